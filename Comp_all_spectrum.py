@@ -1,7 +1,7 @@
 import matplotlib.pyplot as plt
-import pandas as pd
 import numpy as np
-from scipy.optimize import curve_fit
+from spectrum_reader import read_tot_histogram
+from peak_fit import fit_gaussian_peaks
 
 # Define the Gaussian function for single peak fitting
 def gaussian(E, A, mu, sigma):
@@ -50,25 +50,21 @@ plt.figure(figsize=(10, 6))
 
 for file_path, temperature, color, linestyle in files:
     try:
-        # Read the data
-        data = pd.read_csv(file_path, header=None, sep=r'\s+', comment='#')
-        
-        # Extract the fourth column (index 3)
-        fourth_column = data[3]
+        # Histogram the fourth column (index 3, TOT) chunk by chunk, without loading the whole file
+        counts, bins, _, _ = read_tot_histogram(file_path, bins=100, range=(0, 200), cache=True)
         
         # Plot histogram without density normalization
-        counts, bins, _ = plt.hist(fourth_column, bins=100, range=(0, 200), alpha=0.3, density=False)
+        plt.hist(bins[:-1], bins=bins, weights=counts, alpha=0.3, density=False)
         
         # Use midpoints of bins as x data for fitting
         bin_centers = (bins[:-1] + bins[1:]) / 2
 
         # Ensure counts are non-zero for fitting
         if np.any(counts > 0):
-            # Initial guesses for single Gaussian
-            initial_guess = [max(counts), np.mean(fourth_column), np.std(fourth_column)]
-
-            # Fit the single Gaussian curve to the histogram data
-            popt, _ = curve_fit(gaussian, bin_centers, counts, p0=initial_guess, maxfev=100000)
+            # Fit the single Gaussian to the histogram: closed-form start refined by Poisson maximum likelihood
+            popt, converged = fit_gaussian_peaks(bin_centers, counts)
+            if not converged:
+                print(f"Fit did not converge for file {file_path}.")
 
             # Extract fitted parameters
             A, mu, sigma = popt
@@ -1,8 +1,12 @@
-import pandas as pd
+import os
+import numpy as np
+from calibration_store import CalibrationStore, read_results_file
 
 # File paths
 spectrum_file_path = r'D:\Elavenil\Miun\Phase 6\Text files\Thresholdscan\Energy for AgMean.txt'
 slope_intercept_file_path = r'D:\Elavenil\Miun\Phase 6\Text files\slope_intercept_results_thresholdscan.txt'
+# Calibration store built from the slope-intercept file, rebuilt only when that file is newer
+calibration_store_path = os.path.splitext(slope_intercept_file_path)[0] + '.npz'
 
 # Function to parse the spectrum energy file
 def parse_spectrum_file(file_path):
@@ -20,41 +24,27 @@ def parse_spectrum_file(file_path):
                 
     return ikrum_data
 
-# Function to parse the slope-intercept file
-def parse_slope_intercept_file(file_path):
-    slope_intercept_data = {}
-    
-    with open(file_path, 'r', encoding='ISO-8859-1') as file:  # Changed encoding
-        # Skip the header line
-        next(file)
-        
-        for line in file:
-            parts = line.strip().split(',')
-            if len(parts) == 4:
-                ikrum = parts[0].strip()
-                temperature = int(parts[1].strip())
-                slope = float(parts[2].strip())
-                intercept = float(parts[3].strip())  # We will use slope and intercept
-                
-                # Store slope and intercept by Ikrum and Temperature
-                slope_intercept_data[(ikrum, temperature)] = (slope, intercept)
-    
-    return slope_intercept_data
+# Load the calibration store, parsing the slope-intercept file only when the store is missing or out of date
+def load_calibration_store(results_path, store_path):
+    if os.path.exists(store_path) and os.path.getmtime(store_path) >= os.path.getmtime(results_path):
+        return CalibrationStore.load(store_path)
+    store = read_results_file(results_path, mode='thl')
+    store.save(store_path)
+    return store
 
 
 # Parse the spectrum file
 spectrum_data = parse_spectrum_file(spectrum_file_path)
+if not spectrum_data:
+    print(f"No 'Actual Energy' entries found in: {spectrum_file_path}")
+else:
+    ikrums, temperatures, actual_energies = (np.array(column) for column in zip(*spectrum_data))
 
-# Parse the slope-intercept file
-slope_intercept_data = parse_slope_intercept_file(slope_intercept_file_path)
+    # Corrected energies y = mx + c for all entries at once; slope and intercept are interpolated between the
+    # calibrated temperatures, entries without a calibration for their Ikrum come out as NaN
+    store = load_calibration_store(slope_intercept_file_path, calibration_store_path)
+    corrected_energies = store.correct(actual_energies, ikrums, temperatures, mode='thl')
 
-# Calculate and print the corrected energies
-for ikrum_info, temperature, actual_energy in spectrum_data:
-    # Check if the (ikrum, temperature) pair exists in the slope-intercept data
-    if (ikrum_info, temperature) in slope_intercept_data:
-        slope, intercept = slope_intercept_data[(ikrum_info, temperature)]
-        
-        # Calculate the corrected energy using the formula y = mx + c
-        corrected_energy = (slope * actual_energy) + intercept
-        
-        print(f"Ikrum: {ikrum_info}, Temperature: {temperature}°C, Actual Energy: {actual_energy:.4f} keV, Corrected Energy: {corrected_energy:.4f} keV")
+    for ikrum_info, temperature, actual_energy, corrected_energy in zip(ikrums, temperatures, actual_energies, corrected_energies):
+        if np.isfinite(corrected_energy):
+            print(f"Ikrum: {ikrum_info}, Temperature: {temperature}°C, Actual Energy: {actual_energy:.4f} keV, Corrected Energy: {corrected_energy:.4f} keV")
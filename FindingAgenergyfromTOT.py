@@ -1,7 +1,10 @@
 import matplotlib.pyplot as plt
 import re
-from lmfit.models import LinearModel
 import numpy as np
+from calibration_fit import fit_lines, inverse_predict, check_with_lmfit
+
+# Refit every label with lmfit as a cross-check of the batched fits (needs lmfit installed)
+CHECK_WITH_LMFIT = False
 
 # Given x-values (Energy) for Cu, Zr, Mo
 x = [8.04, 15.7, 17.5]  # Energy values corresponding to Cu, Zr, Mo
@@ -35,26 +38,29 @@ if not data:
     print("No valid data found in the file. Please check the file format or encoding.")
 else:
     plt.figure(figsize=(8, 6))  # Set figure size
-    
-    for idx, (label, y_values, unknown_tot) in enumerate(data):
-        # Fit a linear model
-        linear_model = LinearModel()
-        params = linear_model.make_params()
-        result = linear_model.fit(y_values, params, x=x)
 
-        # Predict energy for the unknown TOT value
-        slope = result.best_values['slope']
-        intercept = result.best_values['intercept']
-        predicted_energy = (unknown_tot - intercept) / slope
+    # Fit the lines of all labels at once and predict the energy of every unknown TOT value, with its error
+    # propagated from the fit
+    y_sets = [y_values for label, y_values, unknown_tot in data]
+    fits = fit_lines(x, y_sets)
+    predicted_energies, energy_errors = inverse_predict(fits, [unknown_tot for label, y_values, unknown_tot in data])
+
+    if CHECK_WITH_LMFIT:
+        check_with_lmfit(x, y_sets, fits, [label for label, y_values, unknown_tot in data])
+
+    for idx, (label, y_values, unknown_tot) in enumerate(data):
+        slope = fits['slope'][idx]
+        intercept = fits['intercept'][idx]
+        predicted_energy = predicted_energies[idx]
 
-        print(f"{label}: Mean TOT = {unknown_tot:.2f}, Predicted Energy = {predicted_energy:.2f} eV")
+        print(f"{label}: Mean TOT = {unknown_tot:.2f}, Predicted Energy = {predicted_energy:.2f} ± {energy_errors[idx]:.2f} eV")
 
         # Plot the original data
         plt.plot(x, y_values, 'ko-', label=f'{label}')
 
         # Plot the fitted line
         extended_x = np.linspace(min(x), max(x) + 10, 100)  # Smooth extension
-        extended_y = result.eval(x=extended_x)
+        extended_y = slope * extended_x + intercept
         plt.plot(extended_x, extended_y, 'r--', label=f'Fit {idx+1}')
 
         # Plot the predicted point for the unknown TOT value
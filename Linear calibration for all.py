@@ -1,6 +1,10 @@
 import matplotlib.pyplot as plt
 import re
-from lmfit.models import LinearModel
+import numpy as np
+from calibration_fit import fit_lines, check_with_lmfit
+
+# Refit every label with lmfit as a cross-check of the batched fits (needs lmfit installed)
+CHECK_WITH_LMFIT = False
 
 # Predefined x values (example)
 x = [8, 15.7, 17.4]  # x-axis values (e.g., Temperature)
@@ -29,20 +33,20 @@ all_data = extract_all_data(r'D:\Elavenil\Miun\Phase 6\Text files\Mean (TOT) val
 if not all_data:
     print("No data found in the file.")
 else:
-    # Initialize the linear model
-    linear_model = LinearModel()
+    # Fit the lines of all labels at once
+    fits = fit_lines(x, [y for y, label in all_data])
+    if CHECK_WITH_LMFIT:
+        check_with_lmfit(x, [y for y, label in all_data], fits, [label for y, label in all_data])
 
     # Plotting the data (all in black)
-    for y, label in all_data:
-        # Fit the linear model to the data
-        params = linear_model.make_params()  # Initialize parameters
-        result = linear_model.fit(y, params, x=x)  # Fit the model to the data
+    for (y, label), fit in zip(all_data, fits):
+        best_fit = fit['slope'] * np.asarray(x) + fit['intercept']
 
         # Plot the original data points
         plt.plot(x, y, color='black', linestyle='-', marker='o')
 
         # Plot the fitted line
-        plt.plot(x, result.best_fit, color='red', linestyle='--', label=f'Fit for {label}')
+        plt.plot(x, best_fit, color='red', linestyle='--', label=f'Fit for {label}')
         
         # Annotate the label at the end of the line
         plt.text(x[-1], y[-1], label, color='black', verticalalignment='top', horizontalalignment='left', fontsize=8)
@@ -1,7 +1,7 @@
 import matplotlib.pyplot as plt
-import pandas as pd
 import numpy as np
-from scipy.optimize import curve_fit
+from spectrum_reader import read_tot_histogram
+from peak_fit import fit_multi_gaussian
 
 # Define the 
 # Gaussian function for single peak fitting
@@ -27,14 +27,11 @@ files = [
 plt.figure(figsize=(10, 6))
 
 for file_path, temperature, color in files:  # Unpack three values: file_path, temperature, color
-    # Read the data
-    data = pd.read_csv(file_path, header=None, sep=r'\s+', comment='#')
-    
-    # Extract the fifth column
-    fifth_column = data[3]
+    # Histogram the TOT column (index 3) of the file chunk by chunk
+    counts, bins, _, _ = read_tot_histogram(file_path, bins=100, range=(0, 100), cache=True)
     
     # Plot histogram without density normalization
-    counts, bins, _ = plt.hist(fifth_column, bins=100, range=(0, 100), alpha=0.3, label=f'{temperature} histogram', density=False)
+    plt.hist(bins[:-1], bins=bins, weights=counts, alpha=0.3, label=f'{temperature} histogram', density=False)
     
     # Find the maximum count in the histogram
     max_count = np.max(counts)
@@ -43,29 +40,14 @@ for file_path, temperature, color in files:  # Unpack three values: file_path, t
     # Use midpoints of bins as x data for fitting
     bin_centers = (bins[:-1] + bins[1:]) / 2
 
-    # Initial guesses based on specified means of 11 and 18, using max count as amplitude
-    initial_guess_double = [
-        max(counts),  # Amplitude for the first peak
-        11,           # Mean for the first peak
-        5,            # Standard deviation for the first peak
-
-        max(counts) / 2,  # Amplitude for the second peak
-        25,               # Mean for the second peak
-        5                 # Standard deviation for the second peak
-    ]
-
-    # Apply bounds to ensure peaks remain close to specified means
-    bounds = (
-        [0, 10, 1, 0, 15, 1],   # Lower bounds (allow some flexibility around means)
-        [np.inf, 12, 15, np.inf, 20, 15]  # Upper bounds
-    )
-    
-    # Fit the Double Gaussian curve to the histogram data
-    try:
-        popt, _ = curve_fit(double_gaussian, bin_centers, counts, p0=initial_guess_double, bounds=bounds)
-    except ValueError as e:
-        print(f"Error during curve fitting for {file_path}: {e}")
+    # Fit the Double Gaussian curve to the histogram data: the two strongest peaks (the lower one and the
+    # Nb peak) seed the initial values and bounds, then binned Poisson maximum likelihood refines them
+    popt, converged = fit_multi_gaussian(bin_centers, counts, n_peaks=2)
+    if len(popt) < 6:
+        print(f"Found {len(popt) // 3} peak(s) instead of 2 for {file_path}")
         continue
+    if not converged:
+        print(f"Double Gaussian fit did not converge for {file_path}")
 
     # Generate Double Gaussian curve with fitted parameters if fitting was successful
     x = np.linspace(0, 40, 1000)  # Limit x to the range 0 to 40
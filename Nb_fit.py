@@ -1,7 +1,7 @@
 import matplotlib.pyplot as plt
-import pandas as pd
 import numpy as np
-from scipy.optimize import curve_fit
+from spectrum_reader import read_tot_histogram
+from peak_fit import fit_multi_gaussian
 
 # Define the Double Gaussian function
 def double_gaussian(E, A1, mu1, sigma1, A2, mu2, sigma2):
@@ -12,47 +12,28 @@ def double_gaussian(E, A1, mu1, sigma1, A2, mu2, sigma2):
 # Specify the input file path
 input_file = r'D:\Elavenil\Miun\Phase 6\Ag data\10_2Ikrum_spectrum.txt'
 
-# Read the data from the file
-data = pd.read_csv(input_file, header=None, sep=r'\s+', comment='#')
-
-# Extract the fifth column
-fifth_column = data[3]
+# Histogram the TOT column (index 3) of the file chunk by chunk
+counts, bins, _, _ = read_tot_histogram(input_file, bins=150, range=(0, 200), cache=True)
 
 # Plot histogram with higher bin resolution
-counts, bins, _ = plt.hist(fifth_column, bins=150, range=(0, 200), alpha=0.5, label='Nb histogram', color='black', density=False)
+plt.hist(bins[:-1], bins=bins, weights=counts, alpha=0.5, label='Nb histogram', color='black', density=False)
 
 # Use midpoints of bins as x data for fitting
 bin_centers = (bins[:-1] + bins[1:]) / 2
 
-# Corrected initial guesses (with tighter sigma values)
-initial_guess_double = [
-    max(counts),  # Amplitude for the first peak
-    35,           # Mean for the first peak
-    2,            # **Narrower sigma for first peak**
-    max(counts) / 2,  # Amplitude for the second peak
-    140,          # Mean for the second peak
-    2             # **Narrower sigma for second peak**
-]
-
-# Print initial guess to verify
-print("Initial guess for double Gaussian fit:", initial_guess_double)
-
-# Apply tighter bounds on sigma to prevent excessive width
-bounds = (
-    [0, 20, 0.1, 0, 80, 0.1],  # Lower bounds: allow more flexibility
-    [np.inf, 50, np.inf, np.inf, 160, np.inf]  # Upper bounds: let sigma be any value
-)
-
-# Fit the Double Gaussian curve to the histogram data
-try:
-    popt, _ = curve_fit(double_gaussian, bin_centers, counts, p0=initial_guess_double, bounds=bounds)
-except ValueError as e:
-    print("Error during curve fitting:", e)
+# Fit the Double Gaussian curve to the histogram data: the two strongest peaks are found in the histogram
+# and seed the initial values and bounds, then refined by binned Poisson maximum likelihood
+popt, converged = fit_multi_gaussian(bin_centers, counts, n_peaks=2)
+if len(popt) < 6:
+    print(f"Found {len(popt) // 3} peak(s) instead of 2, skipping the double Gaussian fit")
+    converged = False
+elif not converged:
+    print("Double Gaussian fit did not converge")
 
 # Generate Double Gaussian curve with fitted parameters if fitting was successful
 x = np.linspace(0, 200, 1000)  # Extended range to 200
 
-if 'popt' in locals():  # Check if fitting succeeded
+if converged:  # Check if fitting succeeded
     double_gaussian_curve = double_gaussian(x, *popt)
 
     # Extract fitted parameters
@@ -75,7 +56,7 @@ plt.legend()
 plt.show()
 
 # Print the fitted parameters for both peaks
-if 'popt' in locals():
+if converged:
     print("Fitted parameters for Peak 1:")
     print("Amplitude (A1):", A1)
     print("Mean (mu1):", mu1)
@@ -1,9 +1,10 @@
 import matplotlib.pyplot as plt
 import glob
+import os
 import numpy as np
-import re
 from scipy.optimize import curve_fit
 from scipy.special import erf
+from thlscan_reader import read_scan_file_sets
 
 # Gaussian function
 def gaussian(x, A, mu, sigma):
@@ -17,58 +18,12 @@ def plot_threshold_vs_pixel_count(file_paths_dict, plot_gaussian_only=False):
     # Create a figure for the first plot
     plt.figure(figsize=(10, 6))
     
-    for temperature, file_paths in file_paths_dict.items():
-        threshold_values = []
-        hits_values = []
-        
-        # Loop to read data from files for each temperature
-        for file_path in file_paths:
-            try:
-                # Open the file and extract the threshold from the 9th line
-                with open(file_path, 'r') as file:
-                    lines = file.readlines()
-
-                    # Extract threshold from the 9th line
-                    threshold_line = lines[8]
-                    match = re.search(r'#\s*THL\s*=\s*(\d+)', threshold_line)
-                    if match:
-                        threshold = int(match.group(1))
-                    else:
-                        print(f"Could not find threshold in file: {file_path}")
-                        continue
-
-                    #     # Process data from the 39th line onward
-                    # data = []
-                    # for line in lines[38:]:
-                    #     if line.startswith('#'):  # Stop if line starts with '#'
-                    #         break
-                    #     values = line.split()
-                    #     if len(values) >= 3:  # Ensure there are at least three columns
-                    #         data.append(float(values[2]))  # Extract third column
-
-                    # hits = sum(data)  # Summing third column values as hits
-                    # Extract hits from the last line
-                    last_line = lines[-1]
-                    match_hits = re.search(r'Hits:\s*(\d+)', last_line)
-                    if match_hits:
-                        hits = int(match_hits.group(1))
-                    else:
-                        print(f"Could not find hits in file: {file_path}")
-                        continue
-
-                    # Append extracted values
-                    threshold_values.append(threshold)
-                    hits_values.append(hits)
-
-            except (IndexError, ValueError, IOError) as e:
-                print(f"Skipping file with error: {file_path} ({e})")
-                continue
-        
-        # Sort the values for better plotting
-        sorted_indices = np.argsort(threshold_values)
-        threshold_values = np.array(threshold_values)[sorted_indices]
-        hits_values = np.array(hits_values)[sorted_indices]
+    # Read the threshold from the header and the hits from the 'Hits:' footer for every temperature,
+    # sorted by threshold; all files share one pool of reader threads
+    scans = read_scan_file_sets(file_paths_dict, mode='footer', workers=os.cpu_count())
+    # scans = read_scan_file_sets(file_paths_dict)  # Summing the pixel table instead
 
+    for temperature, (threshold_values, hits_values) in scans.items():
         # Check if data is available
         if len(threshold_values) < 2 or len(hits_values) < 2:
             print(f"Insufficient data for {temperature}°C.")
@@ -0,0 +1,53 @@
+import numpy as np
+
+
+# Levenberg-Marquardt on a batch of independent problems at once; every problem keeps its own damping factor.
+# params (n, p) holds the starting values and is updated in place; rows with non-finite values are left alone.
+# evaluate(idx, params) -> (state, cost) gives the per-row state (residuals, model values, ...) and cost of the rows
+# idx; normal_equations(idx, params, state) -> (information (k, p, p), gradient (k, p)) gives the Gauss-Newton
+# system of those rows. project(idx, params), if given, maps trial parameters back into the bounds.
+# A row stops once its relative cost change drops below tol or its damping exceeds 1e10. Returns (params, converged)
+def levenberg_marquardt(params, evaluate, normal_equations, max_iter, tol, project=None):
+    n, n_params = params.shape
+    damping = np.full(n, 1e-3)
+    active = np.all(np.isfinite(params), axis=1)
+    converged = np.zeros(n, dtype=bool)
+    state, cost = evaluate(np.arange(n), params)
+
+    for _ in range(max_iter):
+        idx = np.flatnonzero(active)
+        if idx.size == 0:
+            break
+
+        # Damped normal equations (I + damping * diag(I)) delta = g, solved per row
+        information, gradient = normal_equations(idx, params[idx], state[idx])
+        diagonal = np.einsum('nii->ni', information)
+        system = information + (damping[idx, None] * diagonal + 1e-12)[:, :, None] * np.eye(n_params)
+        try:
+            delta = np.linalg.solve(system, gradient[..., None])[..., 0]
+        except np.linalg.LinAlgError:
+            # A singular system in the batch (e.g. a flat pixel): fall back to the pseudo-inverse
+            delta = (np.linalg.pinv(system) @ gradient[..., None])[..., 0]
+
+        trial = params[idx] + delta
+        if project is not None:
+            trial = project(idx, trial)
+        trial_state, trial_cost = evaluate(idx, trial)
+
+        # Accept the step where it lowers the cost, otherwise raise the damping
+        better = np.isfinite(trial_cost) & (trial_cost < cost[idx])
+        accepted = idx[better]
+        rejected = idx[~better]
+        relative_change = (cost[accepted] - trial_cost[better]) / np.maximum(cost[accepted], 1e-300)
+        params[accepted] = trial[better]
+        state[accepted] = trial_state[better]
+        cost[accepted] = trial_cost[better]
+        damping[accepted] = np.maximum(damping[accepted] / 10, 1e-12)
+        damping[rejected] *= 10
+
+        # Stop a row once the cost settles or the damping says no further progress is possible
+        done = np.concatenate([accepted[relative_change < tol], rejected[damping[rejected] > 1e10]])
+        converged[done] = True
+        active[done] = False
+
+    return params, converged
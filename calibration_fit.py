@@ -0,0 +1,108 @@
+import numpy as np
+
+# Groups with fewer points than this get no fit (slope and intercept NaN)
+MIN_FIT_POINTS = 2
+
+
+# Least-squares line y = slope * x + intercept for every group of `by` columns in one pass: a single groupby
+# collects the sums of x, y, x*y, x^2 and y^2 and the fits follow from them in closed form, so the cost does not
+# grow with the number of groups. through_origin fixes the intercept at 0. Points with NaN x or y are left out.
+# Returns a tidy table with the `by` columns and n, slope, intercept and the residual sum of squares (rss), one row
+# per group in order of first appearance; groups with fewer than min_points points have NaN fits
+def fit_linear_groups(df, x, y, by, through_origin=False, min_points=MIN_FIT_POINTS):
+    by = [by] if isinstance(by, str) else list(by)
+    data = df[by].copy()
+    data['x'] = df[x].astype(float)
+    data['y'] = df[y].astype(float)
+    data = data[data['x'].notna() & data['y'].notna()]
+    data['xy'] = data['x'] * data['y']
+    data['xx'] = data['x'] ** 2
+    data['yy'] = data['y'] ** 2
+
+    grouped = data.groupby(by, sort=False)
+    sums = grouped[['x', 'y', 'xy', 'xx', 'yy']].sum()
+    n = grouped.size().to_numpy()
+    sx, sy, sxy, sxx, syy = (sums[column].to_numpy() for column in ['x', 'y', 'xy', 'xx', 'yy'])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if through_origin:
+            slope = sxy / sxx
+            intercept = np.zeros_like(slope)
+        else:
+            slope = (n * sxy - sx * sy) / (n * sxx - sx ** 2)
+            intercept = (sy - slope * sx) / n
+    rss = syy - 2 * slope * sxy - 2 * intercept * sy + slope ** 2 * sxx + 2 * slope * intercept * sx + n * intercept ** 2
+    rss = np.maximum(rss, 0)
+
+    enough = n >= min_points
+    results = sums.index.to_frame(index=False)
+    results['n'] = n
+    results['slope'] = np.where(enough, slope, np.nan)
+    results['intercept'] = np.where(enough, intercept, np.nan)
+    results['rss'] = np.where(enough, rss, np.nan)
+    return results
+
+
+
+# Result of fit_lines: one record per line, with the one-sigma errors and slope/intercept covariance
+LINE_FIT_DTYPE = np.dtype([('slope', np.float64), ('intercept', np.float64), ('slope_err', np.float64),
+                           ('intercept_err', np.float64), ('covariance', np.float64), ('n', np.int64),
+                           ('rss', np.float64)])
+
+
+# Least-squares lines y = slope * x + intercept for many small data sets at once: y is (n_lines, n_points) and x is
+# either shared (n_points,) or per line (n_lines, n_points); NaN points are left out. All lines are solved together
+# from their sums, with standard errors from the residual variance (NaN for lines with only two points).
+# Returns a LINE_FIT_DTYPE array with one record per line
+def fit_lines(x, y):
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    x = np.broadcast_to(np.asarray(x, dtype=float), y.shape)
+    used = np.isfinite(x) & np.isfinite(y)
+    x = np.where(used, x, 0.0)
+    y = np.where(used, y, 0.0)
+
+    n = used.sum(axis=1)
+    sx, sy = x.sum(axis=1), y.sum(axis=1)
+    sxx, sxy, syy = (x * x).sum(axis=1), (x * y).sum(axis=1), (y * y).sum(axis=1)
+
+    fits = np.empty(y.shape[0], dtype=LINE_FIT_DTYPE)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        determinant = n * sxx - sx ** 2
+        slope = (n * sxy - sx * sy) / determinant
+        intercept = (sy - slope * sx) / n
+        rss = np.maximum(syy - slope * sxy - intercept * sy, 0)
+        variance = np.where(n > 2, rss / (n - 2), np.nan)
+        fits['slope_err'] = np.sqrt(variance * n / determinant)
+        fits['intercept_err'] = np.sqrt(variance * sxx / determinant)
+        fits['covariance'] = -variance * sx / determinant
+    fits['slope'] = slope
+    fits['intercept'] = intercept
+    fits['n'] = n
+    fits['rss'] = rss
+    return fits
+
+
+# Inverse prediction of fit_lines results: x = (values - intercept) / slope for every line, with its one-sigma error
+# propagated from the slope/intercept covariance and from value_errors. values broadcast against the lines
+def inverse_predict(fits, values, value_errors=0.0):
+    values = np.asarray(values, dtype=float)
+    slope, intercept = fits['slope'], fits['intercept']
+    x = (values - intercept) / slope
+    variance = (np.asarray(value_errors, dtype=float) ** 2 + fits['intercept_err'] ** 2
+                + x ** 2 * fits['slope_err'] ** 2 + 2 * x * fits['covariance']) / slope ** 2
+    return x, np.sqrt(np.maximum(variance, 0))
+
+
+# Refit every line of fit_lines (same x and y) with lmfit's LinearModel and print both results next to each other,
+# one line per label. lmfit is imported here, so it is only needed when the check is run
+def check_with_lmfit(x, y, fits, labels):
+    from lmfit.models import LinearModel
+
+    linear_model = LinearModel()
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    x = np.broadcast_to(np.asarray(x, dtype=float), y.shape)
+    for line_x, line_y, fit, label in zip(x, y, fits, labels):
+        used = np.isfinite(line_x) & np.isfinite(line_y)
+        result = linear_model.fit(line_y[used], linear_model.make_params(), x=line_x[used])
+        print(f"{label}: slope {fit['slope']:.6g} (lmfit {result.best_values['slope']:.6g}), "
+              f"intercept {fit['intercept']:.6g} (lmfit {result.best_values['intercept']:.6g})")
@@ -0,0 +1,156 @@
+import numpy as np
+from scipy.interpolate import BSpline
+
+# Default basis of slope(T) and intercept(T): polynomials of this degree in temperature
+DEFAULT_DEGREE = 2
+
+# Cubic B-splines use this many interior knots, spaced evenly over the fitted temperature range
+SPLINE_DEGREE = 3
+DEFAULT_KNOTS = 3
+
+
+# Basis functions of temperature, evaluated as a (n, n_basis) design block. Temperatures are mapped onto [-1, 1]
+# over the fitted range (polynomials, for conditioning) or clipped to it (splines, which do not extrapolate)
+class TemperatureBasis:
+    def __init__(self, kind, t_min, t_max, degree=DEFAULT_DEGREE, n_knots=DEFAULT_KNOTS):
+        if kind not in ('poly', 'spline'):
+            raise ValueError(f"unknown temperature basis {kind!r}, expected 'poly' or 'spline'")
+        self.kind = kind
+        self.t_min = float(t_min)
+        self.t_max = float(t_max)
+        self.degree = int(degree)
+        self.n_knots = int(n_knots)
+        if kind == 'spline':
+            interior = np.linspace(-1, 1, self.n_knots + 2)[1:-1]
+            self.knots = np.concatenate([np.full(SPLINE_DEGREE + 1, -1.0), interior, np.full(SPLINE_DEGREE + 1, 1.0)])
+
+    @property
+    def size(self):
+        return self.degree + 1 if self.kind == 'poly' else self.n_knots + SPLINE_DEGREE + 1
+
+    def __call__(self, temperature):
+        half_span = max((self.t_max - self.t_min) / 2, 1e-12)
+        u = (np.asarray(temperature, dtype=float).ravel() - (self.t_max + self.t_min) / 2) / half_span
+        if self.kind == 'poly':
+            return np.vander(u, self.degree + 1, increasing=True)
+        return BSpline.design_matrix(np.clip(u, -1, 1), self.knots, SPLINE_DEGREE).toarray()
+
+
+# Calibration y = slope(T) * x + intercept(T) of every Ikrum setting, with slope(T) and intercept(T) expanded in a
+# temperature basis. Holds the basis coefficients of all settings as a (n_settings, n_params) array (slope
+# coefficients first, then intercept coefficients) with their covariance, and evaluates any temperatures in one pass
+class TemperatureModel:
+    def __init__(self, settings, basis, params, covariance, through_origin=False, n_points=None):
+        self.settings = [str(setting) for setting in settings]
+        self.basis = basis
+        self.params = np.asarray(params, dtype=float)
+        self.covariance = np.asarray(covariance, dtype=float)
+        self.through_origin = bool(through_origin)
+        self.n_points = np.zeros(len(self.settings), dtype=np.int64) if n_points is None else np.asarray(n_points)
+        self._index = {setting: number for number, setting in enumerate(self.settings)}
+
+    # Row of every event's Ikrum setting, -1 for settings that were not fitted
+    def _setting_numbers(self, ikrum, shape):
+        ikrum = np.asarray(ikrum, dtype=str)
+        names, inverse = np.unique(ikrum.ravel(), return_inverse=True)
+        lookup = np.array([self._index.get(name, -1) for name in names.tolist()], dtype=np.int64)
+        return np.broadcast_to(lookup[inverse].reshape(ikrum.shape), shape).ravel()
+
+    # Design rows (basis values) and coefficient rows of every event, flattened; NaN coefficients for unknown settings
+    def _evaluate(self, ikrum, temperature):
+        temperature = np.asarray(temperature, dtype=float)
+        shape = np.broadcast_shapes(np.shape(ikrum), temperature.shape)
+        number = self._setting_numbers(ikrum, shape)
+        design = self.basis(np.broadcast_to(temperature, shape))
+        coefficients = np.full((number.size, self.params.shape[1]), np.nan)
+        known = number >= 0
+        coefficients[known] = self.params[number[known]]
+        return shape, number, design, coefficients
+
+    # Slope and intercept at the given temperatures, broadcast over ikrum and temperature
+    def coefficients(self, ikrum, temperature):
+        shape, _, design, coefficients = self._evaluate(ikrum, temperature)
+        n_basis = self.basis.size
+        slope = np.einsum('ij,ij->i', design, coefficients[:, :n_basis])
+        if self.through_origin:
+            intercept = np.where(np.isnan(slope), np.nan, 0.0)
+        else:
+            intercept = np.einsum('ij,ij->i', design, coefficients[:, n_basis:])
+        return slope.reshape(shape), intercept.reshape(shape)
+
+    # One-sigma uncertainties of slope and intercept at the given temperatures, from the coefficient covariance
+    def coefficient_errors(self, ikrum, temperature):
+        shape, number, design, _ = self._evaluate(ikrum, temperature)
+        n_basis = self.basis.size
+        covariance = np.full((number.size,) + self.covariance.shape[1:], np.nan)
+        known = number >= 0
+        covariance[known] = self.covariance[number[known]]
+        slope_var = np.einsum('ij,ijk,ik->i', design, covariance[:, :n_basis, :n_basis], design)
+        if self.through_origin:
+            intercept_var = np.where(np.isnan(slope_var), np.nan, 0.0)
+        else:
+            intercept_var = np.einsum('ij,ijk,ik->i', design, covariance[:, n_basis:, n_basis:], design)
+        return np.sqrt(slope_var).reshape(shape), np.sqrt(intercept_var).reshape(shape)
+
+    # Corrected values slope(T) * values + intercept(T)
+    def correct(self, values, ikrum, temperature):
+        slope, intercept = self.coefficients(ikrum, temperature)
+        return slope * np.asarray(values, dtype=float) + intercept
+
+    def save(self, path):
+        basis = self.basis
+        np.savez_compressed(path, settings=np.array(self.settings, dtype=str), params=self.params,
+                            covariance=self.covariance, n_points=self.n_points, through_origin=self.through_origin,
+                            kind=basis.kind, t_range=np.array([basis.t_min, basis.t_max]), degree=basis.degree,
+                            n_knots=basis.n_knots)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as saved:
+            t_min, t_max = saved['t_range']
+            basis = TemperatureBasis(str(saved['kind']), t_min, t_max, int(saved['degree']), int(saved['n_knots']))
+            return cls(saved['settings'], basis, saved['params'], saved['covariance'],
+                       bool(saved['through_origin']), saved['n_points'])
+
+
+# Fit y = slope(T) * x + intercept(T) for every Ikrum setting at once from all calibration points (rows of df with
+# columns x, y, temperature and by). Every point contributes basis(T) * x (and basis(T)) to a design row; the normal
+# equations of all settings are summed in one pass and solved as a stack, so the cost is one pass over the points
+# whatever the number of settings or temperatures. kind='poly' uses polynomials of `degree`, kind='spline' cubic
+# B-splines with n_knots interior knots. Settings without enough points to fix every coefficient get NaN
+def fit_temperature_model(df, x, y, temperature='Temperature', by='Ikrum', kind='poly', degree=DEFAULT_DEGREE,
+                          n_knots=DEFAULT_KNOTS, through_origin=False):
+    data = df[[x, y, temperature, by]].dropna()
+    x_values = data[x].to_numpy(dtype=float)
+    y_values = data[y].to_numpy(dtype=float)
+    t_values = data[temperature].to_numpy(dtype=float)
+    settings, group = np.unique(data[by].to_numpy().astype(str), return_inverse=True)
+
+    basis = TemperatureBasis(kind, t_values.min(), t_values.max(), degree, n_knots)
+    design = basis(t_values)
+    columns = [design * x_values[:, None]] if through_origin else [design * x_values[:, None], design]
+    design = np.hstack(columns)
+    n_params = design.shape[1]
+
+    # Per-setting normal equations X'X, X'y and y'y
+    n_settings = len(settings)
+    xtx = np.zeros((n_settings, n_params, n_params))
+    np.add.at(xtx, group, design[:, :, None] * design[:, None, :])
+    xty = np.zeros((n_settings, n_params))
+    np.add.at(xty, group, design * y_values[:, None])
+    yty = np.bincount(group, weights=y_values ** 2, minlength=n_settings)
+    n_points = np.bincount(group, minlength=n_settings)
+
+    solvable = (np.linalg.matrix_rank(xtx) == n_params) & (n_points > n_params)
+    coefficients = np.full((n_settings, n_params), np.nan)
+    covariance = np.full((n_settings, n_params, n_params), np.nan)
+    if solvable.any():
+        inverse = np.linalg.inv(xtx[solvable])
+        beta = np.einsum('gij,gj->gi', inverse, xty[solvable])
+        rss = yty[solvable] - 2 * np.einsum('gi,gi->g', beta, xty[solvable]) \
+            + np.einsum('gi,gij,gj->g', beta, xtx[solvable], beta)
+        variance = np.maximum(rss, 0) / (n_points[solvable] - n_params)
+        coefficients[solvable] = beta
+        covariance[solvable] = inverse * variance[:, None, None]
+
+    return TemperatureModel(settings, basis, coefficients, covariance, through_origin, n_points)
@@ -0,0 +1,178 @@
+import numpy as np
+
+# Calibration modes in use: 'tot' for fits of spectrum (TOT) energies, 'thl' for fits of threshold scan energies
+DEFAULT_MODE = 'tot'
+
+# Pixel of calibrations that hold for the whole chip
+CHIP_PIXEL = -1
+
+
+# Slope/intercept calibrations indexed by (Ikrum, mode, pixel), each measured at one or more temperatures.
+# Records are kept sorted by key and temperature in flat arrays (the same layout as the saved .npz), with a dict from
+# key to its position, so finding a calibration is O(1) and correcting any number of events is one array operation.
+# Between measured temperatures slope and intercept are interpolated linearly; outside them the nearest measured
+# temperature is used. Per-pixel calibrations fall back to the chip-wide one (pixel CHIP_PIXEL) of the same Ikrum/mode
+class CalibrationStore:
+    def __init__(self, ikrum, temperature, slope, intercept, mode=DEFAULT_MODE, pixel=CHIP_PIXEL):
+        temperature = np.asarray(temperature, dtype=float)
+        n = temperature.size
+        ikrum = np.broadcast_to(np.asarray(ikrum, dtype=str), n)
+        mode = np.broadcast_to(np.asarray(mode, dtype=str), n)
+        pixel = np.broadcast_to(np.asarray(pixel, dtype=np.int64), n)
+        slope = np.broadcast_to(np.asarray(slope, dtype=float), n)
+        intercept = np.broadcast_to(np.asarray(intercept, dtype=float), n)
+
+        # Keys numbered in sorted (ikrum, mode, pixel) order, records sorted by key then temperature
+        keys = sorted(set(zip(ikrum.tolist(), mode.tolist(), pixel.tolist())))
+        self._index = {key: number for number, key in enumerate(keys)}
+        record_key = np.array([self._index[key] for key in zip(ikrum.tolist(), mode.tolist(), pixel.tolist())],
+                              dtype=np.int64)
+        order = np.lexsort((temperature, record_key))
+
+        self.keys = keys
+        self.record_key = record_key[order]
+        self.temperature = temperature[order]
+        self.slope = np.ascontiguousarray(slope[order])
+        self.intercept = np.ascontiguousarray(intercept[order])
+        self.offsets = np.searchsorted(self.record_key, np.arange(len(keys) + 1))
+
+        # Temperatures mapped into [0, 1) and added to the key number give one sorted array for all records,
+        # so a (key, temperature) query is a single searchsorted
+        self._t_min = self.temperature.min() if n else 0.0
+        self._t_span = (self.temperature.max() - self._t_min if n else 0.0) + 1.0
+        self._position = self.record_key + self._scaled(self.temperature)
+        self._pixel_keys = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _scaled(self, temperature):
+        return np.clip((temperature - self._t_min) / self._t_span, 0.0, 1.0 - 1e-9)
+
+    # Measured temperatures of one calibration, empty if the key is unknown
+    def temperatures(self, ikrum, mode=DEFAULT_MODE, pixel=CHIP_PIXEL):
+        number = self._index.get((str(ikrum), str(mode), int(pixel)))
+        if number is None:
+            return np.empty(0)
+        return self.temperature[self.offsets[number]:self.offsets[number + 1]]
+
+    # Key numbers of the given pixels (array) for one Ikrum/mode, -1 where neither the pixel nor the chip is calibrated
+    def _pixel_key_numbers(self, ikrum, mode, pixel):
+        table = self._pixel_keys.get((ikrum, mode))
+        if table is None:
+            pixels = [key[2] for key in self.keys if key[:2] == (ikrum, mode) and key[2] != CHIP_PIXEL]
+            table = np.full(max(pixels, default=-1) + 1, self._index.get((ikrum, mode, CHIP_PIXEL), -1), dtype=np.int64)
+            for key_pixel in pixels:
+                table[key_pixel] = self._index[(ikrum, mode, key_pixel)]
+            self._pixel_keys[(ikrum, mode)] = table
+
+        numbers = np.full(pixel.shape, self._index.get((ikrum, mode, CHIP_PIXEL), -1), dtype=np.int64)
+        inside = (pixel >= 0) & (pixel < table.size)
+        numbers[inside] = table[pixel[inside]]
+        return numbers
+
+    # Key number of every event; ikrum and pixel may be scalars or arrays (Ikrum settings are looked up once each)
+    def _key_numbers(self, ikrum, mode, pixel, shape):
+        mode = str(mode)
+        ikrum = np.asarray(ikrum, dtype=str)
+        settings, inverse = np.unique(ikrum.ravel(), return_inverse=True)
+        ikrum_index = np.broadcast_to(inverse.reshape(ikrum.shape), shape)
+        pixel = None if pixel is None else np.broadcast_to(np.asarray(pixel, dtype=np.int64), shape)
+
+        numbers = np.full(shape, -1, dtype=np.int64)
+        for index, setting in enumerate(settings.tolist()):
+            selected = ikrum_index == index
+            if pixel is None:
+                numbers[selected] = self._index.get((setting, mode, CHIP_PIXEL), -1)
+            else:
+                numbers[selected] = self._pixel_key_numbers(setting, mode, pixel[selected])
+        return numbers
+
+    # Slope and intercept for every event at its temperature, as arrays broadcast over ikrum, temperature and pixel;
+    # NaN where no calibration exists
+    def coefficients(self, ikrum, temperature, mode=DEFAULT_MODE, pixel=None):
+        temperature = np.asarray(temperature, dtype=float)
+        shape = np.broadcast_shapes(np.shape(ikrum), temperature.shape, np.shape(pixel) if pixel is not None else ())
+        temperature = np.broadcast_to(temperature, shape)
+        number = self._key_numbers(ikrum, mode, pixel, shape)
+        known = number >= 0
+
+        slope = np.full(shape, np.nan)
+        intercept = np.full(shape, np.nan)
+        number = number[known]
+        t = temperature[known]
+        first = self.offsets[number]
+        last = self.offsets[number + 1] - 1
+
+        # Records on both sides of t within its calibration, clamped to the measured range
+        above = np.searchsorted(self._position, number + self._scaled(t), side='right')
+        low = np.clip(above - 1, first, last)
+        high = np.clip(above, first, last)
+        span = self.temperature[high] - self.temperature[low]
+        weight = np.where(span > 0, (t - self.temperature[low]) / np.where(span > 0, span, 1), 0.0)
+        weight = np.clip(weight, 0.0, 1.0)
+
+        slope[known] = self.slope[low] + weight * (self.slope[high] - self.slope[low])
+        intercept[known] = self.intercept[low] + weight * (self.intercept[high] - self.intercept[low])
+        return slope, intercept
+
+    # Corrected values slope * values + intercept (values are TOT or energies, depending on the calibration mode)
+    def correct(self, values, ikrum, temperature, mode=DEFAULT_MODE, pixel=None):
+        slope, intercept = self.coefficients(ikrum, temperature, mode, pixel)
+        return slope * np.asarray(values, dtype=float) + intercept
+
+    # Record arrays of all calibrations, in the order they are stored
+    def records(self):
+        keys = self.keys
+        ikrum = np.array([keys[number][0] for number in self.record_key], dtype=str)
+        mode = np.array([keys[number][1] for number in self.record_key], dtype=str)
+        pixel = np.array([keys[number][2] for number in self.record_key], dtype=np.int64)
+        return ikrum, mode, pixel, self.temperature, self.slope, self.intercept
+
+    # Store with the records of both; records of `other` replace those of the same key and temperature
+    def merge(self, other):
+        combined = {}
+        for store in (self, other):
+            for ikrum, mode, pixel, t, slope, intercept in zip(*(column.tolist() for column in store.records())):
+                combined[(ikrum, mode, pixel, t)] = (slope, intercept)
+        if not combined:
+            return CalibrationStore([], [], [], [])
+        ikrum, mode, pixel, temperature = zip(*combined)
+        slope, intercept = zip(*combined.values())
+        return CalibrationStore(ikrum, temperature, slope, intercept, mode, pixel)
+
+    def save(self, path):
+        ikrum, mode, pixel, temperature, slope, intercept = self.records()
+        np.savez_compressed(path, ikrum=ikrum, mode=mode, pixel=pixel, temperature=temperature, slope=slope,
+                            intercept=intercept)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as saved:
+            return cls(saved['ikrum'], saved['temperature'], saved['slope'], saved['intercept'], saved['mode'],
+                       saved['pixel'])
+
+    # Store from a fit_linear_groups table (calibration_fit.py) with Ikrum and Temperature columns
+    @classmethod
+    def from_fits(cls, fits, mode=DEFAULT_MODE, ikrum_column='Ikrum', temperature_column='Temperature'):
+        fits = fits[np.isfinite(fits['slope'].to_numpy())]
+        return cls(fits[ikrum_column].to_numpy(), fits[temperature_column].to_numpy(), fits['slope'].to_numpy(),
+                   fits['intercept'].to_numpy(), mode)
+
+
+# Read a "Ikrum, Temperature (°C), Slope, Intercept" results file (slope_interceptfile_create.py) into a store;
+# raises ValueError when the file holds no calibration lines
+def read_results_file(file_path, mode=DEFAULT_MODE):
+    ikrum, temperature, slope, intercept = [], [], [], []
+    with open(file_path, 'r', encoding='ISO-8859-1') as file:
+        next(file)  # Header line
+        for line in file:
+            parts = line.strip().split(',')
+            if len(parts) == 4:
+                ikrum.append(parts[0].strip())
+                temperature.append(int(parts[1].strip()))
+                slope.append(float(parts[2].strip()))
+                intercept.append(float(parts[3].strip()))
+    if not ikrum:
+        raise ValueError(f"no calibration entries in {file_path}")
+    return CalibrationStore(ikrum, temperature, slope, intercept, mode)
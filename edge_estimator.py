@@ -0,0 +1,63 @@
+import numpy as np
+from scipy.interpolate import CubicSpline
+from peak_fit import gaussian_peak, FWHM_PER_SIGMA
+
+
+# Differentiated scan: hits increase per THL step at x[1:], with duplicate thresholds removed
+def differentiate_scan(x, y):
+    y_diff = np.diff(y)
+    x_diff = x[1:]
+
+    # Remove duplicates in x_diff while keeping corresponding y_diff values
+    x_diff, indices = np.unique(x_diff, return_index=True)
+    return x_diff, y_diff[indices]
+
+
+# Not-a-knot cubic spline through the differentiated data (the same interpolant as interp1d(kind='cubic'))
+def peak_spline(x_diff, y_diff):
+    return CubicSpline(x_diff, y_diff)
+
+
+# Mean, sigma, FWHM and half maximum of the peak of a spline on [x_min, x_max].
+# The region above half maximum is found from the exact roots of spline(x) = max/2, so the results are
+# the continuous limit of thresholding the spline on a fine grid: mean and sigma are the mean and standard
+# deviation of x over the region, FWHM is the distance between its first and last crossing
+def spline_peak_stats(spline, x_min, x_max):
+    # Maximum: at a root of the derivative or at one of the ends
+    candidates = np.concatenate([[x_min, x_max], spline.derivative().roots(extrapolate=False)])
+    candidates = candidates[(candidates >= x_min) & (candidates <= x_max)]
+    half_max = spline(candidates).max() / 2
+
+    # Split [x_min, x_max] at the half-maximum crossings and keep the pieces above it
+    crossings = spline.solve(half_max, extrapolate=False)
+    edges = np.unique(np.concatenate([[x_min, x_max], crossings[(crossings > x_min) & (crossings < x_max)]]))
+    starts, ends = edges[:-1], edges[1:]
+    above = spline((starts + ends) / 2) > half_max
+    starts, ends = starts[above], ends[above]
+
+    length = (ends - starts).sum()
+    if length <= 0:
+        return np.nan, np.nan, 0.0, half_max
+
+    mean = ((ends ** 2 - starts ** 2) / 2).sum() / length
+    variance = ((ends ** 3 - starts ** 3) / 3).sum() / length - mean ** 2
+    fwhm = ends[-1] - starts[0]
+    return mean, np.sqrt(max(variance, 0.0)), fwhm, half_max
+
+
+# Mean, sigma and FWHM = 2.355 sigma of the closed-form Gaussian peak (see peak_fit.gaussian_peak)
+def gaussian_peak_stats(x, y, fraction=0.2):
+    _, mean, sigma = gaussian_peak(x, y, fraction)
+    return mean, sigma, FWHM_PER_SIGMA * sigma
+
+
+# Mean, sigma and FWHM of the edge of a threshold scan (x sorted, y hits).
+# method='spline' reproduces the interpolated half-maximum analysis of david_thlscan.py without the
+# 1000-point grid; method='gaussian' uses the closed-form Gaussian of the differentiated data
+def estimate_edge(x, y, method='spline'):
+    x_diff, y_diff = differentiate_scan(np.asarray(x), np.asarray(y))
+    if method == 'gaussian':
+        return gaussian_peak_stats(x_diff, y_diff)
+
+    mean, sigma, fwhm, _ = spline_peak_stats(peak_spline(x_diff, y_diff), x_diff.min(), x_diff.max())
+    return mean, sigma, fwhm
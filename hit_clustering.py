@@ -0,0 +1,160 @@
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from spectrum_reader import CHUNK_BYTES
+from spectrum_binary import iter_hit_chunks
+
+# Two hits belong to the same cluster when they are on the same or 8-neighbouring pixels and their ToA differ by at
+# most this much (in ToA units); clusters are the connected groups of such pairs
+DEFAULT_WINDOW = 200
+
+# New hits taken per pass; clusters still open at the end of a pass are carried into the next one, so the result does
+# not depend on it (unless a single open cluster outgrows it, see iter_cluster_events)
+CLUSTER_CHUNK_HITS = 2 ** 21
+
+EVENT_DTYPE = np.dtype([('toa', np.float64), ('x', np.float64), ('y', np.float64), ('size', np.uint32),
+                        ('tot', np.float64)])
+
+# Forward 8-neighbour offsets (dx, dy); the other four directions are the same pairs seen from the other hit
+_NEIGHBOUR_OFFSETS = ((1, -1), (1, 0), (1, 1), (0, 1))
+
+
+# Label the hits of one pass (sorted by ToA) into clusters; returns (labels, n_clusters).
+# Hits are sorted by (pixel, ToA). Hits of one pixel are linked to the next hit of the same pixel when within the
+# window; for every forward neighbour pixel a hit is linked to that pixel's nearest hit before and after it in time
+# when within the window. Any other in-window pair is then connected through the same-pixel chains, so the resulting
+# sparse connected-components labelling joins exactly the pairs within `window` of each other
+def _label_clusters(x, y, toa, window):
+    n = x.size
+    width = int(x.max()) + 3
+    # Pixels are shifted by one so the offsets never wrap into a neighbouring row
+    pixel = (y + 1) * width + (x + 1)
+
+    # (pixel, ToA rank) as one integer key; rank_after counts the hits up to and including each hit's ToA
+    rank = np.searchsorted(toa, toa, side='left')
+    rank_after = np.searchsorted(toa, toa, side='right')
+    key = pixel * (n + 1) + rank
+    order = np.argsort(key, kind='stable')
+    sorted_key = key[order]
+    sorted_pixel = pixel[order]
+    sorted_toa = toa[order]
+    sorted_after = rank_after[order]
+    rows = []
+    cols = []
+
+    # Consecutive hits of the same pixel
+    same = np.flatnonzero((sorted_pixel[1:] == sorted_pixel[:-1]) & (sorted_toa[1:] - sorted_toa[:-1] <= window))
+    rows.append(order[same])
+    cols.append(order[same + 1])
+
+    # Shifted sorted keys stay sorted, which keeps the lookups cache friendly
+    for dx, dy in _NEIGHBOUR_OFFSETS:
+        neighbour_pixel = sorted_pixel + (dy * width + dx)
+        after = np.searchsorted(sorted_key, neighbour_pixel * (n + 1) + sorted_after)
+        # Nearest hit of the neighbour pixel at or before, and after, each hit's ToA
+        for position in (after - 1, after):
+            found = (position >= 0) & (position < n)
+            position = np.where(found, position, 0)
+            found &= sorted_pixel[position] == neighbour_pixel
+            found &= np.abs(sorted_toa[position] - sorted_toa) <= window
+            rows.append(order[found])
+            cols.append(order[position[found]])
+
+    rows = np.concatenate(rows)
+    cols = np.concatenate(cols)
+    graph = coo_matrix((np.ones(rows.size, dtype=np.int8), (rows, cols)), shape=(n, n))
+    n_clusters, labels = connected_components(graph, directed=False)
+    return labels, n_clusters
+
+
+# Events of one pass in label order: size, summed TOT, TOT-weighted centroid and earliest ToA of every cluster
+def _cluster_events(x, y, toa, tot, labels, n_clusters):
+    tot = tot.astype(float)
+    events = np.empty(n_clusters, dtype=EVENT_DTYPE)
+    events['size'] = np.bincount(labels, minlength=n_clusters)
+    events['tot'] = np.bincount(labels, weights=tot, minlength=n_clusters)
+
+    # Hits with zero TOT still count, so the centroid falls back to the plain mean for all-zero clusters
+    weight_sum = events['tot']
+    safe = weight_sum > 0
+    for name, values in (('x', x), ('y', y)):
+        weighted = np.bincount(labels, weights=values * tot, minlength=n_clusters)
+        plain = np.bincount(labels, weights=values.astype(float), minlength=n_clusters)
+        events[name] = np.where(safe, weighted / np.where(safe, weight_sum, 1), plain / events['size'])
+
+    first = np.full(n_clusters, np.inf)
+    np.minimum.at(first, labels, toa.astype(float))
+    events['toa'] = first
+    return events
+
+
+# Cluster a stream of hit chunks (x, y, ToA, TOT arrays) into events, one pass per chunk. Chunks may be unsorted
+# inside but must follow each other in ToA order (as in a time-ordered hit list). After each pass the clusters whose
+# last hit is within `window` of the newest ToA may still grow; their hits are carried into the next pass and the
+# other clusters are yielded as EVENT_DTYPE arrays. A carry that grows beyond chunk_hits (a pixel firing faster than
+# the window without pause) is closed anyway to bound memory. Yielded events are sorted by ToA within each array only
+def iter_cluster_events(chunks, window=DEFAULT_WINDOW, chunk_hits=CLUSTER_CHUNK_HITS):
+    carry = None
+    for chunk in chunks:
+        x, y, toa, tot = (np.asarray(values) for values in chunk)
+        if carry is not None:
+            x, y, toa, tot = (np.concatenate([carried, values]) for carried, values in zip(carry, (x, y, toa, tot)))
+        if toa.size == 0:
+            continue
+
+        # Signed ToA, so differences in both directions can be compared with the window
+        toa = toa.astype(np.int64) if toa.dtype.kind in 'ui' else toa.astype(float)
+        order = np.argsort(toa, kind='stable')
+        x, y, toa, tot = x[order].astype(np.int64), y[order].astype(np.int64), toa[order], tot[order]
+        labels, n_clusters = _label_clusters(x, y, toa, window)
+        events = _cluster_events(x, y, toa, tot, labels, n_clusters)
+
+        last = np.full(n_clusters, -np.inf)
+        np.maximum.at(last, labels, toa.astype(float))
+        open_clusters = last >= float(toa[-1]) - window
+        carried = open_clusters[labels]
+        if carried.sum() > chunk_hits:
+            open_clusters[:] = False
+            carried[:] = False
+
+        carry = (x[carried], y[carried], toa[carried], tot[carried])
+        closed = events[~open_clusters]
+        yield closed[np.argsort(closed['toa'], kind='stable')]
+
+    if carry is not None and carry[2].size:
+        x, y, toa, tot = carry
+        labels, n_clusters = _label_clusters(x, y, toa, window)
+        events = _cluster_events(x, y, toa, tot, labels, n_clusters)
+        yield events[np.argsort(events['toa'], kind='stable')]
+
+
+def _collect_events(event_arrays):
+    events = [array for array in event_arrays if array.size]
+    if not events:
+        return np.empty(0, dtype=EVENT_DTYPE)
+    events = np.concatenate(events)
+    return events[np.argsort(events['toa'], kind='stable')]
+
+
+# Cluster hits into events: hits on the same or neighbouring pixels within `window` ToA units of each other are one
+# event (see iter_cluster_events). Works in passes of chunk_hits hits taken in ToA order.
+# Returns the events (EVENT_DTYPE: toa, x, y, size, tot) sorted by ToA
+def cluster_hits(x, y, toa, tot, window=DEFAULT_WINDOW, chunk_hits=CLUSTER_CHUNK_HITS):
+    toa = np.asarray(toa)
+    order = None if np.all(toa[1:] >= toa[:-1]) else np.argsort(toa, kind='stable')
+
+    def sorted_slice(values, start, stop):
+        values = np.asarray(values)
+        return values[start:stop] if order is None else values[order[start:stop]]
+
+    chunks = ((sorted_slice(x, start, start + chunk_hits), sorted_slice(y, start, start + chunk_hits),
+               sorted_slice(toa, start, start + chunk_hits), sorted_slice(tot, start, start + chunk_hits))
+              for start in range(0, toa.size, chunk_hits))
+    return _collect_events(iter_cluster_events(chunks, window, chunk_hits))
+
+
+# Cluster the hits of a spectrum file into events, streaming it in passes of about chunk_bytes (spectrum_binary.
+# iter_hit_chunks; the file must be in ToA order between chunks and chunk_hits bounds the carried open clusters,
+# see iter_cluster_events); see cluster_hits
+def cluster_spectrum_file(file_path, window=DEFAULT_WINDOW, chunk_hits=CLUSTER_CHUNK_HITS, chunk_bytes=CHUNK_BYTES):
+    return _collect_events(iter_cluster_events(iter_hit_chunks(file_path, chunk_bytes), window, chunk_hits))
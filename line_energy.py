@@ -0,0 +1,3 @@
+# Line energy of each calibration material in keV, shared by the spectrum fits (energy resolution) and the per-pixel
+# calibration (Am 59.4 keV as in slope_interceptfile_create.py)
+LINE_ENERGY = {'Cu': 8.04, 'Zr': 15.7, 'Mo': 17.5, 'Ag': 22.1, 'Am': 59.4}
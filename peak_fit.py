@@ -0,0 +1,238 @@
+import numpy as np
+from scipy.signal import find_peaks
+from batch_lm import levenberg_marquardt
+
+# FWHM of a Gaussian in units of sigma
+FWHM_PER_SIGMA = 2 * np.sqrt(2 * np.log(2))
+
+
+# Gaussian function for single peak fitting
+def gaussian(E, A, mu, sigma):
+    return A * np.exp(-((E - mu) ** 2) / (2 * sigma ** 2))
+
+
+# Sum of Gaussians with flat parameters (A1, mu1, sigma1, A2, mu2, sigma2, ...), like double_gaussian in Nb_fit.py
+def multi_gaussian(E, *params):
+    return sum(gaussian(E, *params[i:i + 3]) for i in range(0, len(params), 3))
+
+
+# Model of a batch of histograms: x (m,), params (n, 3K) for K Gaussians each -> (n, m)
+def _model(x, params):
+    A, mu, sigma = params[:, 0::3, None], params[:, 1::3, None], params[:, 2::3, None]
+    return (A * np.exp(-((x - mu) ** 2) / (2 * sigma ** 2))).sum(axis=1)
+
+
+# Analytic Jacobian of _model with respect to every parameter -> (n, 3K, m)
+def _jacobian(x, params):
+    A, mu, sigma = params[:, 0::3, None], params[:, 1::3, None], params[:, 2::3, None]
+    dx = x - mu
+    shape = np.exp(-dx ** 2 / (2 * sigma ** 2))
+    peak = A * shape
+
+    jacobian = np.empty((params.shape[0], params.shape[1], x.size))
+    jacobian[:, 0::3] = shape
+    jacobian[:, 1::3] = peak * dx / sigma ** 2
+    jacobian[:, 2::3] = peak * dx ** 2 / sigma ** 3
+    return jacobian
+
+
+# Poisson deviance 2 * sum(mu - y + y ln(y / mu)) of every histogram over the bins in mask (all bins if None);
+# model values are floored to stay finite
+def poisson_deviance(counts, model, mask=None):
+    model = np.maximum(model, 1e-300)
+    log_term = np.where(counts > 0, counts * np.log(np.where(counts > 0, counts, 1) / model), 0.0)
+    terms = model - counts + log_term
+    return 2 * (terms if mask is None else np.where(mask, terms, 0.0)).sum(axis=-1)
+
+
+# Closed-form Gaussian (A, mu, sigma) of the highest peak of each row: Caruana's parabola through ln(y), weighted by
+# y^2 in the normal equations as in Guo's refinement (suppresses noisy tails), over the contiguous run of points above
+# `fraction` of the maximum. All rows are solved at once from their 3x3 normal equations. y is (m,) or (n, m);
+# rows with fewer than three positive points in the run or an upward parabola give NaN
+def gaussian_peak(x, y, fraction=0.2):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    single = y.ndim == 1
+    y = np.atleast_2d(y)
+
+    # Contiguous run of points above fraction * max around the maximum of every row
+    index = np.arange(x.size)
+    peak = np.argmax(y, axis=1)[:, None]
+    below = y <= fraction * y.max(axis=1, keepdims=True)
+    left = np.where(below & (index < peak), index, -1).max(axis=1, keepdims=True) + 1
+    right = np.where(below & (index > peak), index, x.size).min(axis=1, keepdims=True)
+    used = (index >= left) & (index < right) & (y > 0)
+    weights = np.where(used, y, 0.0)
+
+    # ln(y) = a + b t + c t^2 with t centred on the run for conditioning
+    n_used = used.sum(axis=1)
+    center = (x * used).sum(axis=1) / np.maximum(n_used, 1)
+    t = x - center[:, None]
+    powers = np.stack([np.ones_like(t), t, t ** 2], axis=1)  # (n, 3, m)
+    w2 = weights ** 2
+    normal = np.einsum('nim,njm,nm->nij', powers, powers, w2)
+    rhs = np.einsum('nim,nm->ni', powers, w2 * np.log(np.where(used, y, 1)))
+
+    params = np.full((y.shape[0], 3), np.nan)
+    solvable = n_used >= 3
+    if solvable.any():
+        a, b, c = np.linalg.solve(normal[solvable], rhs[solvable][..., None])[..., 0].T
+        with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+            sigma = np.sqrt(-1 / (2 * c))
+            mean = center[solvable] - b / (2 * c)
+            A = np.exp(a - b ** 2 / (4 * c))
+        params[solvable] = np.where((c < 0)[:, None], np.column_stack([A, mean, sigma]), np.nan)
+    return tuple(params[0]) if single else params
+
+
+# Default bounds: amplitudes non-negative, widths positive, means free
+def _default_bounds(x, n_params):
+    bin_width = np.min(np.diff(x)) if x.size > 1 else 1.0
+    lower = np.tile([0.0, -np.inf, 1e-3 * bin_width], n_params // 3)
+    upper = np.full(n_params, np.inf)
+    return lower, upper
+
+
+# Binned Poisson maximum-likelihood fit of K Gaussians to a batch of histograms. x (m,) bin centres,
+# counts (n, m) or (m,), p0 (n, 3K) or (3K,) initial parameters, bounds (lower, upper) as in curve_fit with
+# (3K,) or per-histogram (n, 3K) limits, mask (n, m) or (m,) the bins to fit (all if None).
+# Levenberg-Marquardt on the Poisson deviance with the Fisher information J W J^T (W = 1/model) and analytic
+# Jacobians; steps are projected onto the bounds. Returns (params, converged)
+def fit_poisson(x, counts, p0, bounds=None, mask=None, max_iter=100, tol=1e-9):
+    x = np.asarray(x, dtype=float)
+    counts = np.asarray(counts, dtype=float)
+    single = counts.ndim == 1
+    counts = np.atleast_2d(counts)
+    mask = np.ones(counts.shape, dtype=bool) if mask is None else np.broadcast_to(mask, counts.shape)
+    params = np.array(np.broadcast_to(np.asarray(p0, dtype=float), (counts.shape[0], np.shape(p0)[-1])))
+
+    lower, upper = _default_bounds(x, params.shape[1]) if bounds is None else bounds
+    lower = np.broadcast_to(np.asarray(lower, dtype=float), params.shape)
+    upper = np.broadcast_to(np.asarray(upper, dtype=float), params.shape)
+    params = np.clip(params, lower, upper)
+
+    def evaluate(idx, trial):
+        model = _model(x, trial)
+        return model, poisson_deviance(counts[idx], model, mask[idx])
+
+    # Fisher information J W J^T and score J (counts W - 1) of the Poisson likelihood, W = 1 / model
+    def normal_equations(idx, trial, model):
+        J = _jacobian(x, trial)
+        weights = np.where(mask[idx], 1 / np.maximum(model, 1e-12), 0.0)
+        information = np.einsum('nim,njm,nm->nij', J, J, weights)
+        score = np.einsum('nim,nm->ni', J, np.where(mask[idx], counts[idx] * weights - 1, 0.0))
+        return information, score
+
+    def project(idx, trial):
+        return np.clip(trial, lower[idx], upper[idx])
+
+    params, converged = levenberg_marquardt(params, evaluate, normal_equations, max_iter, tol, project)
+    if single:
+        return params[0], converged[0]
+    return params, converged
+
+
+# Fit one Gaussian to each histogram: closed-form start (gaussian_peak), then the Poisson likelihood
+# refinement over the bins within `window` sigmas of the starting peak (None fits every bin; far-off background bins
+# widen the peak). Returns (params (n, 3) or (3,), converged); rows whose closed form fails start from the moments of
+# the histogram, rows without counts give NaN and are not converged
+def fit_gaussian_peaks(x, counts, bounds=None, window=3.0, max_iter=100, tol=1e-9):
+    x = np.asarray(x, dtype=float)
+    counts = np.asarray(counts, dtype=float)
+    hists = np.atleast_2d(counts)
+    p0 = gaussian_peak(x, hists)
+
+    empty = ~np.any(hists > 0, axis=1)
+    missing = ~np.all(np.isfinite(p0), axis=1) & ~empty
+    if missing.any():
+        totals = np.maximum(hists[missing].sum(axis=1), 1)
+        mean = (hists[missing] * x).sum(axis=1) / totals
+        std = np.sqrt((hists[missing] * (x - mean[:, None]) ** 2).sum(axis=1) / totals)
+        p0[missing] = np.column_stack([hists[missing].max(axis=1), mean, np.maximum(std, np.min(np.diff(x)))])
+
+    # Empty rows keep NaN parameters, which fit_poisson leaves alone
+    mask = None
+    if window is not None:
+        mask = np.abs(x - p0[:, 1:2]) <= window * p0[:, 2:3]
+    params, converged = fit_poisson(x, hists, p0, bounds, mask, max_iter, tol)
+    if counts.ndim == 1:
+        return params[0], converged[0]
+    return params, converged
+
+
+# Smoothing of the histogram before the peak search, in bins (sigma of a Gaussian kernel)
+PEAK_SMOOTHING = 1.5
+
+# Minimum prominence of a peak in the negative second derivative, as a fraction of its largest value
+PEAK_MIN_PROMINENCE = 0.05
+
+
+# Smooth a histogram with a Gaussian kernel of `width` bins
+def _smooth(counts, width):
+    if width <= 0:
+        return counts.astype(float)
+    half = int(np.ceil(4 * width))
+    kernel = np.exp(-np.arange(-half, half + 1) ** 2 / (2 * width ** 2))
+    padded = np.pad(counts.astype(float), half, mode='edge')
+    return np.convolve(padded, kernel / kernel.sum(), mode='valid')
+
+
+# Find up to n_peaks peaks of a histogram (x bin centres, counts (m,)). Candidates are the maxima of the negative
+# second derivative of the smoothed histogram with enough prominence, so shoulders on a larger peak count as well;
+# the n_peaks highest are kept. Returns (A, mu, sigma) seeds of shape (K, 3) sorted by mu, K <= n_peaks, with
+# sigma from the inflection points (second-derivative zero crossings) around each peak
+def find_histogram_peaks(x, counts, n_peaks, smoothing=PEAK_SMOOTHING, min_prominence=PEAK_MIN_PROMINENCE):
+    x = np.asarray(x, dtype=float)
+    smooth = _smooth(np.asarray(counts), smoothing)
+    curvature = -np.gradient(np.gradient(smooth, x), x)
+    if not np.any(curvature > 0):
+        return np.empty((0, 3))
+
+    candidates, _ = find_peaks(curvature, prominence=min_prominence * curvature.max())
+    candidates = candidates[smooth[candidates] > 0]
+    candidates = candidates[np.argsort(smooth[candidates])[::-1][:n_peaks]]
+
+    seeds = []
+    bin_width = np.min(np.diff(x))
+    for peak in np.sort(candidates):
+        left = peak
+        while left > 0 and curvature[left - 1] > 0:
+            left -= 1
+        right = peak
+        while right < x.size - 1 and curvature[right + 1] > 0:
+            right += 1
+        sigma = max((x[right] - x[left]) / 2, bin_width / 2)
+        seeds.append([smooth[peak], x[peak], sigma])
+    return np.array(seeds).reshape(-1, 3)
+
+
+# Initial parameters and bounds for a K-Gaussian fit from peak seeds: every mean stays between the midpoints to
+# its neighbours (so components cannot swap), widths between a quarter of the seed and four times the seed or the
+# distance to the nearest neighbour (a shoulder's seed width is short), amplitudes non-negative
+def seed_bounds(x, seeds):
+    x = np.asarray(x, dtype=float)
+    mu = seeds[:, 1]
+    midpoints = (mu[1:] + mu[:-1]) / 2
+    spacing = np.abs(np.diff(mu))
+    nearest = np.minimum(np.concatenate([[np.inf], spacing]), np.concatenate([spacing, [np.inf]]))
+    max_sigma = np.maximum(seeds[:, 2] * 4, np.where(np.isfinite(nearest), nearest, 0))
+    lower = np.column_stack([np.zeros(len(seeds)), np.concatenate([[x[0]], midpoints]), seeds[:, 2] / 4])
+    upper = np.column_stack([np.full(len(seeds), np.inf), np.concatenate([midpoints, [x[-1]]]), max_sigma])
+    return seeds.ravel(), (lower.ravel(), upper.ravel())
+
+
+# Fit n_peaks Gaussians to a histogram with automatic seeding: peak search, seeds and bounds from seed_bounds,
+# then the Poisson likelihood fit over the bins within `window` sigmas of any seed (None fits every bin).
+# Returns (params, converged) with flat params (A1, mu1, sigma1, ...) sorted by mean; fewer than n_peaks
+# components when fewer peaks are found
+def fit_multi_gaussian(x, counts, n_peaks, window=3.0, smoothing=PEAK_SMOOTHING, max_iter=100, tol=1e-9):
+    x = np.asarray(x, dtype=float)
+    seeds = find_histogram_peaks(x, counts, n_peaks, smoothing)
+    if len(seeds) == 0:
+        return np.empty(0), False
+
+    p0, bounds = seed_bounds(x, seeds)
+    mask = None
+    if window is not None:
+        mask = np.any(np.abs(x - seeds[:, 1:2]) <= window * seeds[:, 2:3], axis=0)
+    return fit_poisson(x, counts, p0, bounds, mask, max_iter, tol)
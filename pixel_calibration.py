@@ -0,0 +1,157 @@
+import numpy as np
+from spectrum_reader import CHUNK_BYTES
+from spectrum_binary import iter_hit_chunks
+from pixel_spectra import accumulate_pixel_spectra
+from pixel_peaks import extract_pixel_peaks
+from line_energy import LINE_ENERGY
+
+# The threshold parameter t is searched on this many points between 0 and T_MAX_FRACTION of the lowest line energy
+T_GRID_POINTS = 64
+T_MAX_FRACTION = 0.95
+
+# Pixels need a peak for at least this many lines (the surrogate has four parameters)
+MIN_CALIBRATION_POINTS = 4
+
+SURROGATE_PARAMS = ('a', 'b', 'c', 't')
+
+
+# Surrogate TOT response of the pixels: TOT = a * E + b - c / (E - t)
+def surrogate_tot(energy, a, b, c, t):
+    return a * energy + b - c / (energy - t)
+
+
+# Energy of TOT values under the surrogate: the root E > t of a * E^2 + (b - TOT - a * t) * E - (b - TOT) * t - c = 0.
+# NaN where the parameters are NaN or there is no real root
+def surrogate_energy(tot, a, b, c, t):
+    offset = b - np.asarray(tot, dtype=float)
+    linear = offset - a * t
+    constant = -offset * t - c
+    with np.errstate(divide='ignore', invalid='ignore'):
+        discriminant = linear ** 2 - 4 * a * constant
+        return (-linear + np.sqrt(discriminant)) / (2 * a)
+
+
+# Weighted least-squares a, b, c of every pixel for given t (for fixed t the surrogate is linear in a, b, c).
+# energies (m,), tot (n, m), weights (n, m) 0/1 and t a scalar or one value per pixel (n,); returns params (n, 3)
+# and the residual sum of squares (n,)
+def _solve_linear(energies, tot, weights, t):
+    t = np.asarray(t, dtype=float).reshape(-1, 1)
+    design = np.stack(np.broadcast_arrays(energies[None, :], np.ones((1, energies.size)), -1 / (energies[None, :] - t)),
+                      axis=2)
+    if design.shape[0] == 1:
+        # One t for all pixels: the design is shared and the normal equations are a single matrix product
+        outer = (design[0, :, :, None] * design[0, :, None, :]).reshape(energies.size, 9)
+        normal = (weights @ outer).reshape(-1, 3, 3)
+        rhs = (weights * tot) @ design[0]
+        design = np.broadcast_to(design, tot.shape + (3,))
+    else:
+        normal = np.einsum('nm,nmi,nmj->nij', weights, design, design, optimize=True)
+        rhs = np.einsum('nm,nmi,nm->ni', weights, design, tot, optimize=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        params = np.linalg.solve(normal + 1e-12 * np.eye(3), rhs[:, :, None])[:, :, 0]
+    residual = tot - np.einsum('nmi,ni->nm', design, params)
+    return params, (weights * residual ** 2).sum(axis=1)
+
+
+# Fit the surrogate TOT = a * E + b - c / (E - t) to every pixel at once. tot_maps is (m, rows, cols) (peak TOT of
+# m lines), valid the matching mask (or None) and energies the m line energies. For fixed t the fit is linear, so
+# a, b, c of all pixels are solved together on a grid of t below the lowest energy; the best grid point of each pixel
+# is refined by a parabola through its neighbours and solved once more. Returns a dict of (rows, cols) maps 'a', 'b',
+# 'c', 't', 'rss' and 'valid' (pixels with at least min_points lines and a finite fit)
+def fit_surrogate_maps(tot_maps, energies, valid=None, min_points=MIN_CALIBRATION_POINTS, n_grid=T_GRID_POINTS):
+    energies = np.asarray(energies, dtype=float)
+    tot_maps = np.asarray(tot_maps, dtype=float)
+    shape = tot_maps.shape[1:]
+    tot = tot_maps.reshape(len(energies), -1).T
+    usable = np.isfinite(tot) if valid is None else np.asarray(valid).reshape(len(energies), -1).T & np.isfinite(tot)
+    weights = usable.astype(float)
+    tot = np.where(usable, tot, 0.0)
+
+    n_pixels = tot.shape[0]
+    fitted = usable.sum(axis=1) >= min_points
+    t_grid = np.linspace(0, T_MAX_FRACTION * energies.min(), n_grid)
+    rss_grid = np.full((n_grid, n_pixels), np.inf)
+    for index, t in enumerate(t_grid):
+        _, rss = _solve_linear(energies, tot[fitted], weights[fitted], t)
+        rss_grid[index, fitted] = np.where(np.isfinite(rss), rss, np.inf)
+
+    # Parabolic refinement of t around the best grid point (kept on the grid at the ends of the range)
+    best = np.argmin(rss_grid, axis=0)
+    inner = np.clip(best, 1, n_grid - 2)
+    columns = np.arange(n_pixels)
+    left, centre, right = (rss_grid[inner + shift, columns] for shift in (-1, 0, 1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        curvature = left - 2 * centre + right
+        shift = np.where((best == inner) & (curvature > 0), 0.5 * (left - right) / curvature, 0.0)
+    step = t_grid[1] - t_grid[0]
+    t_best = np.clip(t_grid[inner] + np.nan_to_num(shift) * step, t_grid[0], t_grid[-1])
+    t_best = np.where(best == inner, t_best, t_grid[best])
+
+    params = np.full((n_pixels, 3), np.nan)
+    rss = np.full(n_pixels, np.nan)
+    if fitted.any():
+        params[fitted], rss[fitted] = _solve_linear(energies, tot[fitted], weights[fitted], t_best[fitted])
+
+    maps = {name: params[:, index].reshape(shape) for index, name in enumerate(SURROGATE_PARAMS[:3])}
+    maps['t'] = np.where(fitted, t_best, np.nan).reshape(shape)
+    maps['rss'] = rss.reshape(shape)
+    maps['valid'] = (fitted & np.all(np.isfinite(params), axis=1)).reshape(shape)
+    return maps
+
+
+# Per-pixel surrogate calibration from PixelSpectra accumulators (pixel_spectra.py) of calibration sources, given as
+# {material: spectra}. The peak of every material is extracted per pixel (extract_pixel_peaks) and placed at its
+# LINE_ENERGY (or energies[material]); returns the maps of fit_surrogate_maps
+def calibrate_pixel_spectra(spectra_by_material, energies=None, min_points=MIN_CALIBRATION_POINTS, **peak_options):
+    energies = LINE_ENERGY if energies is None else energies
+    materials = sorted(spectra_by_material, key=lambda material: energies[material])
+    tot_maps = []
+    valid_maps = []
+    for material in materials:
+        mu_map, _, _, valid = extract_pixel_peaks(spectra_by_material[material], **peak_options)
+        tot_maps.append(mu_map)
+        valid_maps.append(valid)
+    return fit_surrogate_maps(np.array(tot_maps), [energies[material] for material in materials],
+                              np.array(valid_maps), min_points)
+
+
+def save_calibration(path, maps):
+    np.savez_compressed(path, **maps)
+
+
+def load_calibration(path):
+    with np.load(path) as saved:
+        return {name: saved[name] for name in saved.files}
+
+
+# Energy of hits (pixel column x, row y, TOT) from the per-pixel calibration maps; NaN for hits outside the matrix
+# or on pixels without a valid calibration. Raw integer TOT is inverted directly: the peak maps the surrogate is
+# fitted to are on the same integer TOT scale (extract_pixel_peaks)
+def hits_to_energy(maps, x, y, tot):
+    rows, cols = maps['valid'].shape
+    x = np.asarray(x).astype(np.int64)
+    y = np.asarray(y).astype(np.int64)
+    inside = (x >= 0) & (x < cols) & (y >= 0) & (y < rows)
+    pixel = np.where(inside, y * cols + x, 0)
+
+    a, b, c, t = (np.where(maps['valid'], maps[name], np.nan).ravel()[pixel] for name in SURROGATE_PARAMS)
+    energy = surrogate_energy(tot, a, b, c, t)
+    return np.where(inside, energy, np.nan)
+
+
+# Calibrated energy of every hit of a spectrum file (binary hit list or text with columns x, y, ..., TOT), in file
+# order, computed chunk by chunk
+def calibrate_hit_file(file_path, maps, chunk_bytes=CHUNK_BYTES):
+    energies = [hits_to_energy(maps, x, y, tot) for x, y, _, tot in iter_hit_chunks(file_path, chunk_bytes)]
+    return np.concatenate(energies) if energies else np.empty(0)
+
+
+# Usage: python pixel_calibration.py calibration.npz Cu="D:\...\Cu_20_10.hits.npy" Zr=... Mo=... Ag=... Am=...
+if __name__ == '__main__':
+    import sys
+
+    sources = dict(argument.split('=', 1) for argument in sys.argv[2:])
+    spectra = {material: accumulate_pixel_spectra(path) for material, path in sources.items()}
+    maps = calibrate_pixel_spectra(spectra)
+    save_calibration(sys.argv[1], maps)
+    print(f"{int(maps['valid'].sum())} of {maps['valid'].size} pixels calibrated, saved to {sys.argv[1]}")
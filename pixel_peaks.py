@@ -0,0 +1,61 @@
+import numpy as np
+from peak_fit import fit_gaussian_peaks, fit_poisson
+
+# Half width of the fit window around the chip peak, in chip-peak sigmas
+PEAK_WINDOW = 4.0
+
+# Pixels with fewer hits than this inside the window are not fitted
+MIN_PIXEL_COUNTS = 50
+
+# Likelihood (Fisher scoring) steps after the moment start
+PIXEL_FIT_STEPS = 8
+
+# Pixels fitted per batch; the histogram block is (chunk_pixels, window bins)
+PIXEL_CHUNK = 8192
+
+
+# Per-pixel Gaussian peak of a PixelSpectra accumulator (pixel_spectra.py) in one batched pass.
+# The whole-chip histogram locates the peak (or pass peak=(mu, sigma) to pick another line); every pixel histogram
+# is cropped to mu +/- window * sigma, started from its moments in that window and refined with a few Poisson
+# likelihood steps. Returns (mu_map, sigma_map, count_map, valid) as (rows, cols) maps in TOT; valid marks
+# pixels with at least min_counts hits whose fit is finite and stays inside the window
+def extract_pixel_peaks(spectra, peak=None, window=PEAK_WINDOW, min_counts=MIN_PIXEL_COUNTS, n_steps=PIXEL_FIT_STEPS,
+                        chunk_pixels=PIXEL_CHUNK):
+    # TOT is an integer, so a bin stands for the mean of the integer values it holds, not its geometric centre
+    x = spectra.bin_edges[:-1] + (spectra.bin_width - 1) / 2
+    if peak is None:
+        (_, chip_mu, chip_sigma), _ = fit_gaussian_peaks(x, spectra.chip_histogram())
+    else:
+        chip_mu, chip_sigma = peak
+
+    in_window = np.flatnonzero(np.abs(x - chip_mu) <= window * chip_sigma)
+    if in_window.size < 3:
+        raise ValueError(f"fit window around TOT {chip_mu:.1f} holds fewer than 3 bins")
+    low, high = in_window[0], in_window[-1] + 1
+    x_window = x[low:high]
+
+    n_pixels = spectra.counts.shape[0]
+    mu = np.full(n_pixels, np.nan)
+    sigma = np.full(n_pixels, np.nan)
+    counts = np.asarray(spectra.counts[:, low:high].sum(axis=1)).ravel()
+
+    fitted = np.flatnonzero(counts >= min_counts)
+    for start in range(0, fitted.size, chunk_pixels):
+        pixels = fitted[start:start + chunk_pixels]
+        histograms = spectra.counts[pixels, low:high].toarray().astype(float)
+
+        # Moments inside the window as the start of the likelihood steps
+        totals = histograms.sum(axis=1)
+        mean = (histograms * x_window).sum(axis=1) / totals
+        std = np.sqrt((histograms * (x_window - mean[:, None]) ** 2).sum(axis=1) / totals)
+        std = np.maximum(std, spectra.bin_width / 2)
+        amplitude = totals * spectra.bin_width / (np.sqrt(2 * np.pi) * std)
+
+        params, _ = fit_poisson(x_window, histograms, np.column_stack([amplitude, mean, std]), max_iter=n_steps)
+        mu[pixels] = params[:, 1]
+        sigma[pixels] = params[:, 2]
+
+    valid = (counts >= min_counts) & np.isfinite(mu) & np.isfinite(sigma)
+    valid &= (mu >= x_window[0]) & (mu <= x_window[-1]) & (sigma > 0) & (sigma < window * chip_sigma)
+    shape = spectra.shape
+    return mu.reshape(shape), sigma.reshape(shape), counts.reshape(shape), valid.reshape(shape)
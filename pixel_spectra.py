@@ -0,0 +1,88 @@
+import numpy as np
+from scipy.sparse import coo_matrix, csr_matrix
+from spectrum_reader import CHUNK_BYTES
+from spectrum_binary import iter_hit_chunks
+from thlscan_cube import MATRIX_SHAPE
+
+# TOT range of the per-pixel histograms: bins of BIN_WIDTH TOT from 0 up to MAX_TOT (higher TOT is dropped)
+MAX_TOT = 1024
+BIN_WIDTH = 1
+
+# Per-pixel TOT histograms of one or more hit lists, kept as a sparse (pixel, TOT bin) count matrix with
+# pixel = row * cols + col (the layout of thlscan_cube frames). Accumulators built from different files or
+# chunks with the same binning add up with merge / +=
+class PixelSpectra:
+    def __init__(self, shape=MATRIX_SHAPE, max_tot=MAX_TOT, bin_width=BIN_WIDTH, counts=None):
+        self.shape = tuple(shape)
+        self.max_tot = max_tot
+        self.bin_width = bin_width
+        self.n_bins = int(np.ceil(max_tot / bin_width))
+        n_pixels = self.shape[0] * self.shape[1]
+        self.counts = csr_matrix((n_pixels, self.n_bins), dtype=np.int64) if counts is None else counts.tocsr()
+
+    # TOT value at the lower edge of every bin
+    @property
+    def bin_edges(self):
+        return np.arange(self.n_bins + 1) * self.bin_width
+
+    # Add hits (pixel column x, row y, TOT) in one vectorised pass: the (pixel, bin) pairs are counted with
+    # np.unique and added as one sparse block. Hits outside the matrix or the TOT range are dropped
+    def add_hits(self, x, y, tot):
+        rows, cols = self.shape
+        x = np.asarray(x).astype(np.int64)
+        y = np.asarray(y).astype(np.int64)
+        tot = np.asarray(tot)
+        inside = (x >= 0) & (x < cols) & (y >= 0) & (y < rows) & (tot >= 0) & (tot < self.max_tot)
+
+        pixel = y[inside] * cols + x[inside]
+        tot_bin = (tot[inside] // self.bin_width).astype(np.int64)
+        keys, key_counts = np.unique(pixel * self.n_bins + tot_bin, return_counts=True)
+        block = coo_matrix((key_counts, (keys // self.n_bins, keys % self.n_bins)), shape=self.counts.shape)
+        self.counts = self.counts + block.tocsr()
+        return self
+
+    def merge(self, other):
+        if (other.shape, other.max_tot, other.bin_width) != (self.shape, self.max_tot, self.bin_width):
+            raise ValueError("cannot merge per-pixel spectra with different matrix shape or binning")
+        self.counts = self.counts + other.counts
+        return self
+
+    def __iadd__(self, other):
+        return self.merge(other)
+
+    # Dense (n, n_bins) histograms of the given flat pixel indices (all pixels if None)
+    def histograms(self, pixels=None):
+        counts = self.counts if pixels is None else self.counts[np.asarray(pixels)]
+        return counts.toarray()
+
+    # Histogram of the pixel at (row, col)
+    def pixel_histogram(self, row, col):
+        return self.histograms([row * self.shape[1] + col])[0]
+
+    # Whole-chip histogram and the number of hits of every pixel as a (rows, cols) map
+    def chip_histogram(self):
+        return np.asarray(self.counts.sum(axis=0)).ravel()
+
+    def hit_map(self):
+        return np.asarray(self.counts.sum(axis=1)).reshape(self.shape)
+
+    def save(self, path):
+        counts = self.counts
+        np.savez_compressed(path, data=counts.data, indices=counts.indices, indptr=counts.indptr,
+                            shape=np.array(self.shape), max_tot=self.max_tot, bin_width=self.bin_width)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as saved:
+            spectra = cls(tuple(saved['shape']), int(saved['max_tot']), saved['bin_width'].item())
+            spectra.counts = csr_matrix((saved['data'], saved['indices'], saved['indptr']), shape=spectra.counts.shape)
+        return spectra
+
+
+# Accumulate the per-pixel TOT histograms of a spectrum file (binary hit list or text with columns x, y, ..., TOT)
+# chunk by chunk; pass `spectra` to add to an existing accumulator
+def accumulate_pixel_spectra(file_path, spectra=None, chunk_bytes=CHUNK_BYTES, **binning):
+    spectra = PixelSpectra(**binning) if spectra is None else spectra
+    for x, y, _, tot in iter_hit_chunks(file_path, chunk_bytes):
+        spectra.add_hits(x, y, tot)
+    return spectra
@@ -1,10 +1,10 @@
 import matplotlib.pyplot as plt
 import glob
 import numpy as np
-import re
 from scipy.optimize import curve_fit
 from scipy.special import erf
 from scipy.signal import savgol_filter, find_peaks
+from thlscan_reader import read_scan_files
 
 # Gaussian function
 def gaussian(x, A, mu, sigma):
@@ -15,46 +15,8 @@ def error_function(x, A, mu, sigma):
     return A * (1 + erf((x - mu) / (np.sqrt(2) * sigma))) / 2
 
 def plot_threshold_vs_pixel_count(file_paths):
-    threshold_values = []
-    hits_values = []
-    
-    # Loop to read data from files
-    for file_path in file_paths:
-        try:
-            # Open the file and extract the threshold from the 9th line
-            with open(file_path, 'r') as file:
-                lines = file.readlines()
-                
-                # Extract threshold from the 9th line
-                threshold_line = lines[8]
-                match = re.search(r'#\s*THL\s*=\s*(\d+)', threshold_line)
-                if match:
-                    threshold = int(match.group(1))
-                else:
-                    print(f"Could not find threshold in file: {file_path}")
-                    continue
-                
-                # Extract hits from the last line
-                last_line = lines[-1]
-                match_hits = re.search(r'Hits:\s*(\d+)', last_line)
-                if match_hits:
-                    hits = int(match_hits.group(1))
-                else:
-                    print(f"Could not find hits in file: {file_path}")
-                    continue
-                
-                # Append extracted values
-                threshold_values.append(threshold)
-                hits_values.append(hits)
-
-        except (IndexError, ValueError, IOError) as e:
-            print(f"Skipping file with error: {file_path} ({e})")
-            continue
-    
-    # Sort the values for better plotting
-    sorted_indices = np.argsort(threshold_values)
-    threshold_values = np.array(threshold_values)[sorted_indices]
-    hits_values = np.array(hits_values)[sorted_indices]
+    # Read the threshold from the header and the hits from the 'Hits:' footer, sorted by threshold
+    threshold_values, hits_values = read_scan_files(file_paths, mode='footer', cache=True)
     
     # Check if data is available
     if len(threshold_values) < 2 or len(hits_values) < 2:
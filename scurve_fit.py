@@ -0,0 +1,98 @@
+import numpy as np
+from scipy.special import erf
+from batch_lm import levenberg_marquardt
+
+SQRT2 = np.sqrt(2)
+SQRT2PI = np.sqrt(2 * np.pi)
+
+
+# Error function (scaled CDF of Gaussian), same model as plot_thl_scan.py; a negative sigma gives a falling edge
+def error_function(x, A, mu, sigma):
+    return A * (1 + erf((x - mu) / (SQRT2 * sigma))) / 2
+
+
+# Model values for a batch of S-curves: x (m,), params (n, 3) -> (n, m)
+def _model(x, params):
+    z = (x[None, :] - params[:, 1:2]) / (SQRT2 * params[:, 2:3])
+    return params[:, 0:1] * (1 + erf(z)) / 2
+
+
+# Jacobian rows (d/dA, d/dmu, d/dsigma) for a batch of S-curves -> (n, 3, m)
+def _jacobian(x, params):
+    A = params[:, 0:1]
+    sigma = params[:, 2:3]
+    dx = x[None, :] - params[:, 1:2]
+    z = dx / (SQRT2 * sigma)
+    slope = -A * np.exp(-z ** 2) / (SQRT2PI * sigma)
+
+    jacobian = np.empty((params.shape[0], 3, x.size))
+    jacobian[:, 0] = (1 + erf(z)) / 2
+    jacobian[:, 1] = slope
+    jacobian[:, 2] = slope * dx / sigma
+    return jacobian
+
+
+# Initial (A, mu, sigma) per S-curve from the differentiated counts: the edge position and width are the
+# mean and spread of THL weighted by |dy|, the sign of the total change sets the edge direction
+def initial_guess(x, counts):
+    dy = np.diff(counts, axis=1)
+    x_mid = (x[1:] + x[:-1]) / 2
+    weights = np.abs(dy)
+    total = weights.sum(axis=1)
+    safe_total = np.where(total > 0, total, 1)
+
+    mu = (weights * x_mid).sum(axis=1) / safe_total
+    spread = np.sqrt((weights * (x_mid - mu[:, None]) ** 2).sum(axis=1) / safe_total)
+    step = np.min(np.diff(x)) if x.size > 1 else 1.0
+    sigma = np.maximum(spread, step)
+    sigma = np.where(dy.sum(axis=1) < 0, -sigma, sigma)
+
+    A = counts.max(axis=1).astype(float)
+    mu = np.where(total > 0, mu, x.mean())
+    return np.column_stack([A, mu, sigma])
+
+
+# Levenberg-Marquardt (batch_lm.py) on the least-squares cost of a batch of S-curves at once
+def _fit_batch(x, counts, params, max_iter, tol):
+    def evaluate(idx, trial):
+        residuals = counts[idx] - _model(x, trial)
+        return residuals, (residuals ** 2).sum(axis=1)
+
+    # Normal equations J J^T delta = J r
+    def normal_equations(idx, trial, residuals):
+        J = _jacobian(x, trial)
+        return J @ J.transpose(0, 2, 1), (J @ residuals[:, :, None])[:, :, 0]
+
+    return levenberg_marquardt(params, evaluate, normal_equations, max_iter, tol)
+
+
+# Fit the erf S-curve of every pixel of a threshold-scan cube (n_thl, rows, cols) at once.
+# Returns (threshold_map, noise_map, amplitude_map, converged) with noise = |sigma|; pixels
+# without an edge or whose fit ends outside the scanned THL range are marked as not converged
+def fit_scurves(thresholds, cube, max_iter=50, tol=1e-8, chunk_size=4096):
+    x = np.asarray(thresholds, dtype=float)
+    n_steps = cube.shape[0]
+    map_shape = cube.shape[1:]
+    counts_all = np.asarray(cube).reshape(n_steps, -1)
+    n_pixels = counts_all.shape[1]
+
+    params = np.full((n_pixels, 3), np.nan)
+    converged = np.zeros(n_pixels, dtype=bool)
+
+    # Pixels are fitted in chunks to keep the (chunk, n_thl, 3) Jacobian small
+    for start in range(0, n_pixels, chunk_size):
+        counts = counts_all[:, start:start + chunk_size].T.astype(float)
+        has_edge = counts.max(axis=1) > counts.min(axis=1)
+        if not has_edge.any():
+            continue
+
+        chunk_params = initial_guess(x, counts[has_edge])
+        chunk_params, chunk_converged = _fit_batch(x, counts[has_edge], chunk_params, max_iter, tol)
+
+        pixels = start + np.flatnonzero(has_edge)
+        params[pixels] = chunk_params
+        converged[pixels] = chunk_converged
+
+    amplitude, mu, sigma = params.T
+    valid = converged & np.all(np.isfinite(params), axis=1) & (amplitude > 0) & (mu >= x.min()) & (mu <= x.max())
+    return mu.reshape(map_shape), np.abs(sigma).reshape(map_shape), amplitude.reshape(map_shape), valid.reshape(map_shape)
@@ -1,6 +1,8 @@
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from calibration_fit import fit_linear_groups
+from calibration_model import fit_temperature_model
 
 # Path to the energy calculated_TOT file
 file_path = r'D:\Elavenil\Miun\Phase 6\Text files\New folder\New folder\15Ikrum_energy values.txt'
@@ -52,25 +54,18 @@ df['Material'] = df['Group'].str.extract(r'Group_(\w+)')
 # Map the actual energies based on the 'Material' column
 df['Actual Energy'] = df['Material'].map(actual_energy_values)
 
-# Function to calculate slope forcing the fit through (0,0)
+# Function to calculate slope forcing the fit through (0,0), all Temperature x Ikrum groups in one pass
 def calculate_slope_through_origin(df):
+    fits = fit_linear_groups(df, 'Measured Energy', 'Actual Energy', ['Temperature', 'Ikrum'], through_origin=True)
+    fits = fits.sort_values('Temperature', kind='stable')
+
     results = []
-    for temp in sorted(df['Temperature'].unique()):
-        for ikrum in df['Ikrum'].unique():
-            temp_ikrum_data = df[(df['Temperature'] == temp) & (df['Ikrum'] == ikrum)]
-            
-            if len(temp_ikrum_data) > 1:  # Ensure enough points for linear fit
-                x = temp_ikrum_data['Measured Energy'].values
-                y = temp_ikrum_data['Actual Energy'].values
-                
-                # Compute slope manually (intercept = 0)
-                slope = np.sum(x * y) / np.sum(x ** 2)
-                intercept = 0  # Force fit through (0,0)
-
-                results.append((ikrum, temp, slope, intercept))
-            else:
-                print(f"Not enough data for Ikrum {ikrum} at Temperature {temp}.")
-    
+    for temp, ikrum, slope, intercept in fits[['Temperature', 'Ikrum', 'slope', 'intercept']].itertuples(index=False):
+        if np.isfinite(slope):
+            results.append((ikrum, temp, slope, intercept))
+        else:
+            print(f"Not enough data for Ikrum {ikrum} at Temperature {temp}.")
+
     return results
 
 # Calculate slopes forcing intercept at (0,0)
@@ -83,11 +78,12 @@ def plot_all_fits(df, slope_intercept_results):
     rows = (num_plots // cols) + (num_plots % cols > 0)  # Adjust rows based on number of plots
 
     fig, axes = plt.subplots(rows, cols, figsize=(15, 5 * rows))
+    groups = df.groupby(['Temperature', 'Ikrum'])
     axes = axes.flatten()  # Flatten the 2D array of axes for easy iteration
 
     for i, (ikrum, temp, slope, intercept) in enumerate(slope_intercept_results):
         ax = axes[i]
-        temp_ikrum_data = df[(df['Temperature'] == temp) & (df['Ikrum'] == ikrum)]
+        temp_ikrum_data = groups.get_group((temp, ikrum))
 
         # Scatter plot
         ax.scatter(temp_ikrum_data['Measured Energy'], temp_ikrum_data['Actual Energy'], label="Data Points", s=100)
@@ -124,3 +120,11 @@ with open(output_file_path, 'w') as file:
         file.write(f"{ikrum}, {temp}, {slope:.4f}, {intercept}\n")
 
 print(f"Slope-intercept results saved to: {output_file_path}")
+
+# Continuous calibration over the whole temperature sweep: slope(T) through (0,0) as a quadratic in temperature,
+# fitted for all Ikrum settings at once from the same points and saved for evaluation at any temperature
+temperature_model = fit_temperature_model(df, 'Measured Energy', 'Actual Energy', through_origin=True, degree=2)
+model_file_path = r'D:\Elavenil\Miun\Phase 6\Text files\New folder\New folder\calibration_model_15Ikrum.npz'
+temperature_model.save(model_file_path)
+
+print(f"Temperature calibration model saved to: {model_file_path}")
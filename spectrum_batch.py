@@ -0,0 +1,162 @@
+import csv
+import glob
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import numpy as np
+from spectrum_reader import read_tot_histogram
+from spectrum_binary import HIT_LIST_SUFFIX
+from peak_fit import fit_gaussian_peaks, FWHM_PER_SIGMA
+from line_energy import LINE_ENERGY
+
+# Histogram (bins, TOT range) used for the fit of each material, as in the single-material scripts
+DEFAULT_HISTOGRAM = (100, (0, 200))
+MATERIAL_HISTOGRAM = {'Am': (50, (15, 50))}
+
+# Spectrum file names: [<material>_]<temperature>_<ikrum>[Ik|Ikrum][_spectrum][_Re|_RT].txt, e.g. Cu_10_2_Re.txt,
+# Zr_20_10.txt, 10_10Ikrum_spectrum.txt, 40_50Ik.txt. A missing material comes from a '<material> data' folder,
+# a missing mode from an 'RT' folder (Re otherwise)
+SPECTRUM_NAME_PATTERN = re.compile(
+    r'^(?:(?P<material>[A-Z][a-z]?)_)?(?P<temperature>-?\d+)_(?P<ikrum>\d+)(?:Ik(?:rum)?)?(?:_spectrum)?'
+    r'(?:_(?P<mode>Re|RT))?$')
+MATERIAL_FOLDER_PATTERN = re.compile(r'^(?P<material>[A-Z][a-z]?) data$')
+
+RESULT_FIELDS = ['material', 'temperature', 'ikrum', 'mode', 'A', 'mu', 'sigma', 'fwhm', 'resolution', 'status',
+                 'file']
+
+
+# Material, temperature, Ikrum and mode of a spectrum file (text or binary hit list) from its name and folders;
+# None if it does not match
+def parse_spectrum_name(file_path):
+    name = os.path.basename(file_path)
+    name = name[:-len(HIT_LIST_SUFFIX)] if name.endswith(HIT_LIST_SUFFIX) else os.path.splitext(name)[0]
+    match = SPECTRUM_NAME_PATTERN.match(name)
+    if not match:
+        return None
+
+    folders = os.path.normpath(os.path.dirname(file_path)).replace('\\', '/').split('/')
+    material = match.group('material')
+    if material is None:
+        folder_matches = [MATERIAL_FOLDER_PATTERN.match(folder) for folder in folders]
+        material = next((folder_match.group('material') for folder_match in folder_matches if folder_match), None)
+    if material is None:
+        return None
+
+    mode = match.group('mode') or ('RT' if 'RT' in folders else 'Re')
+    return {'material': material, 'temperature': int(match.group('temperature')), 'ikrum': int(match.group('ikrum')),
+            'mode': mode}
+
+
+# Every spectrum file below root (searched recursively with the glob pattern, '**/*.hits.npy' for binary
+# hit lists) whose name can be parsed, as a list of (file_path, info) sorted by material, mode, Ikrum and temperature
+def find_spectrum_files(root, pattern='**/*.txt'):
+    spectra = []
+    for file_path in glob.glob(os.path.join(root, pattern), recursive=True):
+        info = parse_spectrum_name(file_path)
+        if info is not None:
+            spectra.append((file_path, info))
+    return sorted(spectra, key=lambda spectrum: (spectrum[1]['material'], spectrum[1]['mode'], spectrum[1]['ikrum'],
+                                                  spectrum[1]['temperature'], spectrum[0]))
+
+
+# Histogram (bins, TOT range) used for a material
+def histogram_settings(material):
+    return MATERIAL_HISTOGRAM.get(material, DEFAULT_HISTOGRAM)
+
+
+# Histogram one spectrum and fit its peak (closed-form start, Poisson likelihood refinement, see peak_fit);
+# returns its row of the results table. Failures are recorded in 'status'. cache as in read_tot_histogram
+def fit_spectrum(file_path, info, cache=None):
+    row = dict(info, file=file_path, A=np.nan, mu=np.nan, sigma=np.nan, fwhm=np.nan, resolution=np.nan)
+    bins, tot_range = histogram_settings(info['material'])
+    try:
+        counts, bin_edges, _, _ = read_tot_histogram(file_path, bins=bins, range=tot_range, cache=cache)
+    except (IOError, ValueError) as e:
+        row['status'] = f'failed: {e}'
+        return row
+
+    bin_centers = (bin_edges[:-1] + bin_edges[1:]) / 2
+    if not np.any(counts > 0):
+        row['status'] = 'no data'
+        return row
+
+    (A, mu, sigma), converged = fit_gaussian_peaks(bin_centers, counts)
+    fwhm = FWHM_PER_SIGMA * sigma
+    energy = LINE_ENERGY.get(info['material'], np.nan)
+    row.update(A=A, mu=mu, sigma=sigma, fwhm=fwhm, resolution=fwhm / energy * 100,
+               status='ok' if converged else 'not converged')
+    return row
+
+
+def _fit_spectrum_entry(spectrum, cache):
+    return fit_spectrum(*spectrum, cache=cache)
+
+
+# Fit every spectrum of a list of (file_path, info) in parallel; rows come back in input order
+def fit_spectra(spectra, workers=None, cache=None):
+    if workers is None or workers <= 1 or len(spectra) < 2:
+        return [fit_spectrum(file_path, info, cache) for file_path, info in spectra]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_fit_spectrum_entry, spectra, repeat(cache)))
+
+
+# Write the results table as CSV
+def write_results(rows, output_path):
+    with open(output_path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=RESULT_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+# One line per fit in the format printed by Comp_all_spectrum.py, which the comparison scripts parse
+def format_result(row):
+    label = f"{row['temperature']}°C_{row['ikrum']}Ikrum {row['mode']}"
+    if row['status'] != 'ok':
+        return f"{label}: {row['status']} ({row['file']})"
+    return (f"{label}: μ = {row['mu']:.2f}, σ = {row['sigma']:.2f}, FWHM = {row['fwhm']:.2f} keV, "
+            f"Energy Resolution = {row['resolution']:.2f}%")
+
+
+# One spectrum_plot.render_spectrum job per row, writing <material>_<temperature>_<ikrum>_<mode>.png to figure_dir
+def figure_jobs(rows, figure_dir):
+    jobs = []
+    for row in rows:
+        label = f"{row['temperature']}°C_{row['ikrum']}Ikrum {row['mode']}"
+        name = f"{row['material']}_{row['temperature']}_{row['ikrum']}_{row['mode']}.png"
+        bins, tot_range = histogram_settings(row['material'])
+        jobs.append((row['file'], bins, tot_range, (row['A'], row['mu'], row['sigma']),
+                     f"{row['material']} spectrum {label}", os.path.join(figure_dir, name)))
+    return jobs
+
+
+# Find, fit and tabulate every spectrum below root; returns the rows of the results table.
+# With figure_dir set, one PNG per spectrum is rendered headless (Agg) in worker processes after the fits
+def run_campaign(root, output_path, pattern='**/*.txt', workers=None, cache=True, figure_dir=None):
+    spectra = find_spectrum_files(root, pattern)
+    rows = fit_spectra(spectra, workers, cache)
+    write_results(rows, output_path)
+
+    if figure_dir is not None:
+        from spectrum_plot import render_spectra
+        os.makedirs(figure_dir, exist_ok=True)
+        render_spectra(figure_jobs(rows, figure_dir), workers, cache)
+
+    material = None
+    for row in rows:
+        if row['material'] != material:
+            material = row['material']
+            print(f"{material} spectrum:")
+        print(format_result(row))
+    print(f"{len(rows)} spectra, {sum(row['status'] == 'ok' for row in rows)} fitted, results in {output_path}")
+    if figure_dir is not None:
+        print(f"Figures in {figure_dir}")
+    return rows
+
+
+# Usage: python spectrum_batch.py "D:\Elavenil\Miun\Phase 6\Spectrum data" spectrum_results.csv [figure folder]
+if __name__ == '__main__':
+    import sys
+
+    run_campaign(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else 'spectrum_results.csv', workers=os.cpu_count(),
+                 figure_dir=sys.argv[3] if len(sys.argv) > 3 else None)
@@ -0,0 +1,110 @@
+import os
+import shutil
+import numpy as np
+from spectrum_reader import iter_table_chunks, CHUNK_BYTES
+
+# Binary hit list: a .npy file holding one fixed-size record per hit, in the column order of the text file
+# (x, y, ToA, TOT). The .npy header stores the record layout and the number of hits, so the file opens
+# as a memory-mapped structured array without any parsing
+HIT_DTYPE = np.dtype([('x', np.uint8), ('y', np.uint8), ('toa', np.uint64), ('tot', np.uint16)])
+
+# Suffix of the binary hit list written next to a text spectrum
+HIT_LIST_SUFFIX = '.hits.npy'
+
+_NPY_MAGIC = b'\x93NUMPY'
+
+
+# Cast one parsed text column to a record field, refusing values the narrow dtype cannot hold exactly
+def _cast_field(values, field_dtype, name, file_path):
+    if field_dtype.kind in 'ui':
+        if values.dtype.kind == 'f' and not np.all(values == np.round(values)):
+            raise ValueError(f"{name} of {file_path} holds non-integer values, use a float dtype for it")
+        limits = np.iinfo(field_dtype)
+        if values.size and (values.min() < limits.min or values.max() > limits.max):
+            raise ValueError(f"{name} of {file_path} does not fit in {field_dtype}")
+    return values.astype(field_dtype)
+
+
+# Convert a text spectrum file to a binary hit list, chunk by chunk; returns the number of hits.
+# The records go to a temporary file first, since the .npy header needs the final count
+def convert_hit_list(text_path, binary_path=None, dtype=HIT_DTYPE, chunk_bytes=CHUNK_BYTES):
+    dtype = np.dtype(dtype)
+    if binary_path is None:
+        binary_path = os.path.splitext(text_path)[0] + HIT_LIST_SUFFIX
+    temp_path = f"{binary_path}.{os.getpid()}.tmp"
+
+    n_hits = 0
+    try:
+        with open(temp_path, 'wb') as raw:
+            for table in iter_table_chunks(text_path, range(len(dtype.names)), chunk_bytes):
+                records = np.empty(table.shape[0], dtype=dtype)
+                for i, name in enumerate(dtype.names):
+                    records[name] = _cast_field(table[:, i], dtype[name], name, text_path)
+                records.tofile(raw)
+                n_hits += records.size
+
+        with open(binary_path, 'wb') as out, open(temp_path, 'rb') as raw:
+            header = {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False, 'shape': (n_hits,)}
+            np.lib.format.write_array_header_1_0(out, header)
+            shutil.copyfileobj(raw, out, chunk_bytes)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return n_hits
+
+
+# A file is a binary hit list when it is a .npy file holding a structured array
+def is_hit_list(path):
+    if not isinstance(path, (str, os.PathLike)) or not os.path.isfile(path):
+        return False
+    with open(path, 'rb') as file:
+        if file.read(len(_NPY_MAGIC)) != _NPY_MAGIC:
+            return False
+    try:
+        return read_hit_list(path).dtype.names is not None
+    except ValueError:
+        return False
+
+
+# Open a binary hit list as a read-only memory-mapped structured array (fields x, y, toa, tot);
+# slicing, masks and histograms on it read only the pages they touch
+def read_hit_list(path):
+    return np.load(path, mmap_mode='r')
+
+
+# Yield one field of a binary hit list (by text column index or name) in chunks of about chunk_bytes,
+# as int64 for integer fields and float64 otherwise
+def iter_hit_list_column(path, column, chunk_bytes=CHUNK_BYTES):
+    hits = read_hit_list(path)
+    name = hits.dtype.names[column] if isinstance(column, int) else column
+    values = hits[name]
+    step = max(1, chunk_bytes // hits.dtype.itemsize)
+    for start in range(0, values.size, step):
+        chunk = values[start:start + step]
+        yield chunk.astype(np.int64 if chunk.dtype.kind in 'ui' else np.float64)
+
+
+# Yield the hits of a spectrum file as (x, y, toa, tot) arrays, in chunks of about chunk_bytes: slices of the memory
+# map of a binary hit list, or parsed chunks of a text file with columns x, y, ToA, TOT
+def iter_hit_chunks(file_path, chunk_bytes=CHUNK_BYTES):
+    if is_hit_list(file_path):
+        hits = read_hit_list(file_path)
+        step = max(1, chunk_bytes // hits.dtype.itemsize)
+        for start in range(0, hits.size, step):
+            chunk = hits[start:start + step]
+            yield chunk['x'], chunk['y'], chunk['toa'], chunk['tot']
+        return
+
+    for table in iter_table_chunks(file_path, range(len(HIT_DTYPE.names)), chunk_bytes):
+        yield table[:, 0], table[:, 1], table[:, 2], table[:, 3]
+
+
+# Usage: python spectrum_binary.py "D:\...\Spectrum data\*.txt"   (writes <name>.hits.npy next to each file)
+if __name__ == '__main__':
+    import glob
+    import sys
+
+    for spectrum_path in sorted(glob.glob(sys.argv[1])):
+        n_hits = convert_hit_list(spectrum_path)
+        hit_list_path = os.path.splitext(spectrum_path)[0] + HIT_LIST_SUFFIX
+        print(f"{spectrum_path}: {n_hits} hits, {os.path.getsize(spectrum_path) / os.path.getsize(hit_list_path):.1f}x smaller")
@@ -0,0 +1,42 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import matplotlib
+matplotlib.use('Agg')  # Figures only go to files: no GUI, no windows to close
+import matplotlib.pyplot as plt
+import numpy as np
+from spectrum_reader import read_tot_histogram
+from peak_fit import gaussian
+
+
+# Render one spectrum figure to output_path: the TOT histogram (recomputed from the cached native-resolution
+# histogram when cache is set) with the fitted Gaussian (A, mu, sigma) if params are finite
+def render_spectrum(file_path, bins, tot_range, params, title, output_path, cache=None):
+    counts, bin_edges, _, _ = read_tot_histogram(file_path, bins=bins, range=tot_range, cache=cache)
+
+    figure, ax = plt.subplots(figsize=(10, 6))
+    ax.hist(bin_edges[:-1], bins=bin_edges, weights=counts, alpha=0.3, label='Histogram')
+    if np.all(np.isfinite(params)):
+        A, mu, sigma = params
+        x = np.linspace(bin_edges[0], bin_edges[-1], 1000)
+        ax.plot(x, gaussian(x, A, mu, sigma), color='red', label=f'Fit: μ={mu:.2f}, σ={sigma:.2f}')
+
+    ax.set_xlabel('TOT')
+    ax.set_ylabel('Counts')
+    ax.set_title(title)
+    ax.legend()
+    figure.savefig(output_path)
+    plt.close(figure)
+    return output_path
+
+
+def _render_job(job, cache):
+    return render_spectrum(*job, cache=cache)
+
+
+# Render a list of figure jobs (the arguments of render_spectrum without cache) in worker processes;
+# returns the written paths in input order
+def render_spectra(jobs, workers=None, cache=None):
+    if workers is None or workers <= 1 or len(jobs) < 2:
+        return [_render_job(job, cache) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_render_job, jobs, repeat(cache)))
@@ -0,0 +1,144 @@
+import os
+import numpy as np
+import pandas as pd
+from thlscan_cache import resolve_cache_dir, load_cache_entry, store_cache_entry
+
+# Spectrum (hit-list) files: whitespace-separated columns, '#' starts a comment; TOT is the 4th column
+TOT_COLUMN = 3
+
+# Bytes of text parsed at a time; memory use is a small multiple of this whatever the file size
+CHUNK_BYTES = 16 * 1024 ** 2
+
+# Bytes read from the start of a file to estimate its line length (rows per chunk)
+LINE_SAMPLE_BYTES = 64 * 1024
+
+
+# Rows of about chunk_bytes of text, from the line length at the start of the file
+def _rows_per_chunk(file_path, chunk_bytes):
+    with open(file_path, 'rb') as file:
+        sample = file.read(LINE_SAMPLE_BYTES)
+    return max(1, chunk_bytes * max(sample.count(b'\n'), 1) // max(len(sample), 1))
+
+
+# Yield the given columns of a text spectrum file as 2D tables, one per chunk of about chunk_bytes of text.
+# Parsed by the pandas C engine, converting only the requested columns; '#' starts a comment as in the scripts'
+# pd.read_csv calls. Integer columns come back as int64, anything else as float64.
+# The C tokenizer still splits every field of every line, and that is nearly all of the time: the scripts'
+# whole-file pd.read_csv(sep=r'\s+') already ran on it (pandas handles r'\s+' natively), so this is only about
+# 1.7x faster on the same text. Binary hit lists (spectrum_binary) and the cache are the fast paths
+def iter_table_chunks(file_path, columns, chunk_bytes=CHUNK_BYTES):
+    columns = list(columns)
+    try:
+        reader = pd.read_csv(file_path, sep=r'\s+', header=None, usecols=columns, comment='#', engine='c',
+                             chunksize=_rows_per_chunk(file_path, chunk_bytes))
+    except pd.errors.EmptyDataError:
+        return
+    with reader:
+        for chunk in reader:
+            yield chunk[columns].to_numpy()
+
+
+# Yield the values of one column of a spectrum file chunk by chunk; binary hit lists written by
+# spectrum_binary.convert_hit_list are read from their memory map instead of parsed
+def iter_column_chunks(file_path, column=TOT_COLUMN, chunk_bytes=CHUNK_BYTES):
+    from spectrum_binary import is_hit_list, iter_hit_list_column
+    if is_hit_list(file_path):
+        yield from iter_hit_list_column(file_path, column, chunk_bytes)
+        return
+
+    for table in iter_table_chunks(file_path, [column], chunk_bytes):
+        yield table[:, 0]
+
+
+# Count of every integer value of a column (value -> counts[value]) accumulated chunk by chunk with
+# np.bincount; raises ValueError when the column holds negative or non-integer values
+def read_column_bincount(file_path, column=TOT_COLUMN, chunk_bytes=CHUNK_BYTES):
+    value_counts = np.zeros(0, dtype=np.int64)
+    for values in iter_column_chunks(file_path, column, chunk_bytes):
+        if values.dtype.kind == 'f':
+            if not np.all(values == np.round(values)):
+                raise ValueError(f"column {column} of {file_path} holds non-integer values")
+            values = values.astype(np.int64)
+        if values.size and values.min() < 0:
+            raise ValueError(f"column {column} of {file_path} holds negative values")
+
+        chunk_counts = np.bincount(values)
+        if chunk_counts.size > value_counts.size:
+            value_counts = np.pad(value_counts, (0, chunk_counts.size - value_counts.size))
+        value_counts[:chunk_counts.size] += chunk_counts
+    return value_counts
+
+
+# Native-resolution histogram of an integer column (see read_column_bincount). cache=True (or a directory) keeps
+# it in the .npz sidecar of the file (thlscan_cache), so later calls with any binning skip the raw data
+def read_tot_counts(file_path, column=TOT_COLUMN, cache=None, chunk_bytes=CHUNK_BYTES):
+    cache_dir = resolve_cache_dir(cache)
+    key = f'tot_counts_{column}'
+    if cache_dir is not None:
+        stat = os.stat(file_path)
+        entry = load_cache_entry(file_path, stat, cache_dir)
+        if key in entry:
+            return entry[key].astype(np.int64)
+
+    value_counts = read_column_bincount(file_path, column, chunk_bytes)
+    if cache_dir is not None:
+        store_cache_entry(file_path, stat, cache_dir, {key: value_counts})
+    return value_counts
+
+
+# Rebin or crop native-resolution counts (value -> value_counts[value]) to any binning. Returns
+# (counts, bins, mean, std) like read_tot_histogram: counts and bins equal np.histogram of the underlying values,
+# mean and std are those of all values
+def rebin_counts(value_counts, bins=100, range=(0, 200)):
+    bin_edges = np.histogram_bin_edges([], bins=bins, range=range)
+    tot_values = np.arange(value_counts.size)
+    counts = np.histogram(tot_values, bins=bin_edges, weights=value_counts)[0].astype(np.int64)
+
+    n_values = value_counts.sum()
+    if n_values == 0:
+        return counts, bin_edges, np.nan, np.nan
+    mean = (tot_values * value_counts).sum() / n_values
+    std = np.sqrt(((tot_values - mean) ** 2 * value_counts).sum() / n_values)
+    return counts, bin_edges, mean, std
+
+
+# Histogram one column of a spectrum file (text or binary hit list) without holding the column in memory. Returns
+# (counts, bins, mean, std) where counts and bins match np.histogram / plt.hist on the full column and
+# mean and std are those of all values (the initial guesses of the spectrum fits).
+# With cache set, integer columns go through the cached native-resolution histogram (read_tot_counts) and
+# only the rebinning is redone, so trying other bins or ranges takes milliseconds
+def read_tot_histogram(file_path, bins=100, range=(0, 200), column=TOT_COLUMN, chunk_bytes=CHUNK_BYTES, cache=None):
+    if resolve_cache_dir(cache) is not None:
+        try:
+            return rebin_counts(read_tot_counts(file_path, column, cache, chunk_bytes), bins, range)
+        except ValueError:
+            pass  # Negative or non-integer values: histogram them directly below
+
+    bin_edges = np.histogram_bin_edges([], bins=bins, range=range)
+    counts = np.zeros(bin_edges.size - 1, dtype=np.int64)
+    value_counts = np.zeros(0, dtype=np.int64)
+    n_values, total, total_sq = 0, 0.0, 0.0
+
+    for values in iter_column_chunks(file_path, column, chunk_bytes):
+        n_values += values.size
+        if values.dtype.kind == 'i' and (values.size == 0 or values.min() >= 0):
+            # Integer TOT: count every value, the bins are filled once at the end
+            chunk_counts = np.bincount(values)
+            if chunk_counts.size > value_counts.size:
+                value_counts = np.pad(value_counts, (0, chunk_counts.size - value_counts.size))
+            value_counts[:chunk_counts.size] += chunk_counts
+        else:
+            counts += np.histogram(values, bins=bin_edges)[0]
+            total += values.sum()
+            total_sq += np.square(values, dtype=float).sum()
+
+    if value_counts.size:
+        tot_values = np.arange(value_counts.size)
+        counts += np.histogram(tot_values, bins=bin_edges, weights=value_counts)[0].astype(np.int64)
+        total += (tot_values * value_counts).sum()
+        total_sq += (tot_values.astype(float) ** 2 * value_counts).sum()
+
+    if n_values == 0:
+        return counts, bin_edges, np.nan, np.nan
+    mean = total / n_values
+    return counts, bin_edges, mean, np.sqrt(max(total_sq / n_values - mean ** 2, 0.0))
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+from calibration_store import CalibrationStore, read_results_file, CHIP_PIXEL
+
+
+# Chip-wide calibration of Ikrum5 at 10 and 30 °C, plus a per-pixel one for pixel 5
+def _store():
+    return CalibrationStore(['Ikrum5', 'Ikrum5', 'Ikrum5'], [10, 30, 20], [1.0, 3.0, 10.0], [0.0, 2.0, -5.0],
+                            pixel=[CHIP_PIXEL, CHIP_PIXEL, 5])
+
+
+def test_interpolates_between_temperatures():
+    slope, intercept = _store().coefficients('Ikrum5', [10, 15, 20, 30])
+
+    assert np.allclose(slope, [1.0, 1.5, 2.0, 3.0])
+    assert np.allclose(intercept, [0.0, 0.5, 1.0, 2.0])
+
+
+def test_clamps_outside_calibrated_range():
+    slope, intercept = _store().coefficients('Ikrum5', [-40, 60])
+
+    assert np.allclose(slope, [1.0, 3.0])
+    assert np.allclose(intercept, [0.0, 2.0])
+
+
+def test_pixel_falls_back_to_chip():
+    store = _store()
+    corrected = store.correct([2.0, 2.0, 2.0], 'Ikrum5', 20, pixel=[5, 7, -3])
+
+    assert np.allclose(corrected, [15.0, 5.0, 5.0])
+    assert np.all(np.isnan(store.correct([2.0], 'Ikrum10', 20, pixel=[5])))
+
+
+def test_results_file_round_trip(tmp_path):
+    path = tmp_path / 'results.txt'
+    path.write_text('Ikrum, Temperature (°C), Slope, Intercept\nIkrum5, 10, 1.0, 0.0\nIkrum5, 30, 3.0, 2.0\n',
+                    encoding='ISO-8859-1')
+    store = read_results_file(str(path), mode='thl')
+    store.save(tmp_path / 'store.npz')
+    loaded = CalibrationStore.load(tmp_path / 'store.npz')
+
+    assert np.allclose(loaded.correct(2.0, 'Ikrum5', 20, mode='thl'), 5.0)
+    assert np.isnan(loaded.correct(2.0, 'Ikrum5', 20, mode='tot'))
+
+
+def test_results_file_without_entries(tmp_path):
+    path = tmp_path / 'results.txt'
+    path.write_text('Ikrum, Temperature (°C), Slope, Intercept\n', encoding='ISO-8859-1')
+
+    with pytest.raises(ValueError):
+        read_results_file(str(path))
@@ -0,0 +1,33 @@
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from hit_clustering import cluster_hits
+
+
+# Reference clustering: every pair of hits on the same or neighbouring pixels within the window is linked
+def _pairwise_cluster_sizes(x, y, toa, window):
+    linked = (np.abs(x[:, None] - x) <= 1) & (np.abs(y[:, None] - y) <= 1) & (np.abs(toa[:, None] - toa) <= window)
+    _, labels = connected_components(coo_matrix(linked), directed=False)
+    return np.sort(np.bincount(labels))
+
+
+def test_window_applies_to_each_pair():
+    # The same pixel 300 apart is two events even with an unrelated hit in between
+    events = cluster_hits([5, 5, 100], [5, 5, 100], [0, 300, 150], [1, 1, 1], window=200)
+    assert events.size == 3
+
+
+def test_matches_pairwise_reference_across_passes():
+    rng = np.random.default_rng(0)
+    n = 1200
+    x = rng.integers(0, 16, n)
+    y = rng.integers(0, 16, n)
+    toa = rng.integers(0, 20000, n).astype(np.uint64)
+    tot = rng.integers(1, 50, n)
+    expected = _pairwise_cluster_sizes(x, y, toa.astype(np.int64), 200)
+
+    for chunk_hits in (n, 300, 97):
+        events = cluster_hits(x, y, toa, tot, window=200, chunk_hits=chunk_hits)
+        assert np.array_equal(np.sort(events['size']), expected)
+        assert events['tot'].sum() == tot.sum()
+        assert np.all(np.diff(events['toa']) >= 0)
@@ -0,0 +1,32 @@
+import numpy as np
+from peak_fit import fit_gaussian_peaks, gaussian_peak
+
+
+def test_single_peak_recovered():
+    rng = np.random.default_rng(0)
+    x = np.arange(200) + 0.5
+    counts = rng.poisson(300 * np.exp(-(x - 80) ** 2 / (2 * 9 ** 2)) + 2)
+    (A, mu, sigma), converged = fit_gaussian_peaks(x, counts)
+
+    assert converged
+    assert abs(mu - 80) < 0.3
+    assert abs(sigma - 9) < 0.3
+
+
+def test_empty_histogram_not_converged():
+    x = np.arange(200) + 0.5
+    params, converged = fit_gaussian_peaks(x, np.zeros((2, 200)))
+
+    assert np.all(np.isnan(params))
+    assert not converged.any()
+
+
+def test_batched_closed_form_matches_single_rows():
+    rng = np.random.default_rng(1)
+    x = np.arange(60) + 0.5
+    counts = np.stack([rng.poisson(200 * np.exp(-(x - mu) ** 2 / (2 * 4 ** 2))) for mu in (15, 30, 45)])
+    batched = gaussian_peak(x, counts)
+
+    for row, hist in zip(batched, counts):
+        assert np.allclose(row, gaussian_peak(x, hist))
+    assert np.allclose(batched[:, 1], [15, 30, 45], atol=0.5)
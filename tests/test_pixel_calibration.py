@@ -0,0 +1,39 @@
+import numpy as np
+from pixel_spectra import PixelSpectra
+from pixel_calibration import calibrate_pixel_spectra, hits_to_energy, surrogate_tot
+from line_energy import LINE_ENERGY
+
+SHAPE = (8, 8)
+HITS_PER_PIXEL = 3000
+
+
+# Per-pixel surrogate parameters around a typical Timepix response
+def _pixel_params(rng):
+    n_pixels = SHAPE[0] * SHAPE[1]
+    return (rng.normal(1.6, 0.05, n_pixels), rng.normal(20, 2, n_pixels), rng.normal(30, 5, n_pixels),
+            rng.uniform(2, 6, n_pixels))
+
+
+# Integer TOT hits of one calibration line on every pixel
+def _line_hits(rng, energy, params):
+    n_pixels = SHAPE[0] * SHAPE[1]
+    pixel = np.repeat(np.arange(n_pixels), HITS_PER_PIXEL)
+    mu = surrogate_tot(energy, *params)[pixel]
+    tot = np.round(rng.normal(mu, 0.04 * mu)).astype(np.int64)
+    return pixel % SHAPE[1], pixel // SHAPE[1], tot
+
+
+def test_calibration_lines_round_trip():
+    rng = np.random.default_rng(1)
+    params = _pixel_params(rng)
+    hits = {material: _line_hits(rng, energy, params) for material, energy in LINE_ENERGY.items()}
+
+    spectra = {}
+    for material, (x, y, tot) in hits.items():
+        spectra[material] = PixelSpectra(shape=SHAPE, max_tot=256).add_hits(x, y, tot)
+    maps = calibrate_pixel_spectra(spectra)
+    assert maps['valid'].all()
+
+    for material, (x, y, tot) in hits.items():
+        energy = hits_to_energy(maps, x, y, tot)
+        assert abs(np.nanmedian(energy) - LINE_ENERGY[material]) < 0.005 * LINE_ENERGY[material]
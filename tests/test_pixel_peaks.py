@@ -0,0 +1,33 @@
+import numpy as np
+from pixel_spectra import PixelSpectra
+from pixel_peaks import extract_pixel_peaks
+
+SHAPE = (8, 8)
+
+
+# Every pixel sees integer TOT drawn around its own peak position
+def _simulated_spectra(peak_mu, sigma=3.0, hits_per_pixel=4000, bin_width=1, seed=0):
+    rng = np.random.default_rng(seed)
+    n_pixels = SHAPE[0] * SHAPE[1]
+    pixel = np.repeat(np.arange(n_pixels), hits_per_pixel)
+    tot = np.round(rng.normal(peak_mu.ravel()[pixel], sigma)).astype(np.int64)
+    spectra = PixelSpectra(shape=SHAPE, max_tot=256, bin_width=bin_width)
+    return spectra.add_hits(pixel % SHAPE[1], pixel // SHAPE[1], tot)
+
+
+def test_pixel_mu_matches_peak_position():
+    peak_mu = np.linspace(38, 44, SHAPE[0] * SHAPE[1]).reshape(SHAPE)
+    mu_map, sigma_map, _, valid = extract_pixel_peaks(_simulated_spectra(peak_mu))
+
+    assert valid.all()
+    assert abs(np.median(mu_map - peak_mu)) < 0.05
+    assert np.abs(mu_map - peak_mu).max() < 0.3
+    assert abs(np.median(sigma_map) - 3.0) < 0.15
+
+
+def test_pixel_mu_unbiased_for_wide_bins():
+    peak_mu = np.full(SHAPE, 60.0)
+    mu_map, _, _, valid = extract_pixel_peaks(_simulated_spectra(peak_mu, sigma=6.0, bin_width=4))
+
+    assert valid.all()
+    assert abs(np.median(mu_map - peak_mu)) < 0.1
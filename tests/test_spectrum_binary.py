@@ -0,0 +1,18 @@
+import numpy as np
+from spectrum_binary import convert_hit_list, iter_hit_chunks
+
+
+def test_text_and_binary_hit_chunks_agree(tmp_path):
+    rng = np.random.default_rng(0)
+    hits = np.column_stack([rng.integers(0, 256, 5000), rng.integers(0, 256, 5000),
+                            np.sort(rng.integers(0, 10 ** 9, 5000)), rng.integers(1, 500, 5000)])
+    text_path = tmp_path / 'spectrum.txt'
+    np.savetxt(text_path, hits, fmt='%d', header='x y toa tot')
+    binary_path = tmp_path / 'spectrum.hits.npy'
+    convert_hit_list(str(text_path), str(binary_path))
+
+    for path in (text_path, binary_path):
+        chunks = list(iter_hit_chunks(str(path), chunk_bytes=4096))
+        assert len(chunks) > 1
+        columns = [np.concatenate([chunk[i] for chunk in chunks]) for i in range(4)]
+        assert np.array_equal(np.column_stack(columns), hits)
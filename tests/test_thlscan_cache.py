@@ -0,0 +1,66 @@
+import os
+import numpy as np
+from thlscan_cache import cache_path
+from thlscan_reader import read_scan_file
+
+
+# Scan file with the THL on the 9th line and a one-column-of-hits pixel table from the 39th line
+def _write_scan(path, threshold, hits):
+    header = [f'# header {i}\n' for i in range(38)]
+    header[8] = f'# THL = {threshold}\n'
+    table = ''.join(f'{i} 0 {value}\n' for i, value in enumerate(hits))
+    path.write_text(''.join(header) + table + f'# end\nHits: {sum(hits)}\n')
+
+
+# Rewrite the file with other hits of the same length and restore its mtime, so only the contents differ
+def _rewrite_keeping_stat(path, threshold, hits):
+    stat = os.stat(path)
+    _write_scan(path, threshold, hits)
+    assert os.path.getsize(path) == stat.st_size
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+def test_hit_when_size_and_mtime_unchanged(tmp_path):
+    path = tmp_path / 'scan.txt'
+    _write_scan(path, 850, [1, 2, 7])
+    assert read_scan_file(str(path), cache=tmp_path / 'cache') == (850, 10.0)
+
+    _rewrite_keeping_stat(path, 850, [4, 5, 9])
+    assert read_scan_file(str(path), cache=tmp_path / 'cache') == (850, 10.0)
+    assert read_scan_file(str(path)) == (850, 18.0)
+
+
+def test_rebuilt_after_mtime_change(tmp_path):
+    path = tmp_path / 'scan.txt'
+    _write_scan(path, 850, [1, 2, 7])
+    read_scan_file(str(path), cache=tmp_path / 'cache')
+
+    _rewrite_keeping_stat(path, 850, [4, 5, 9])
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert read_scan_file(str(path), cache=tmp_path / 'cache') == (850, 18.0)
+
+
+def test_rebuilt_after_size_change(tmp_path):
+    path = tmp_path / 'scan.txt'
+    _write_scan(path, 850, [1, 2, 3])
+    read_scan_file(str(path), cache=tmp_path / 'cache')
+
+    stat = os.stat(path)
+    _write_scan(path, 850, [1, 2, 3, 40])
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert read_scan_file(str(path), cache=tmp_path / 'cache') == (850, 46.0)
+
+
+def test_corrupt_sidecar_is_replaced(tmp_path):
+    path = tmp_path / 'scan.txt'
+    cache_dir = tmp_path / 'cache'
+    _write_scan(path, 850, [1, 2, 3])
+    read_scan_file(str(path), cache=cache_dir)
+
+    sidecar = cache_path(str(path), str(cache_dir))
+    with open(sidecar, 'wb') as file:
+        file.write(b'not a zip file')
+    assert read_scan_file(str(path), cache=cache_dir) == (850, 6.0)
+    with np.load(sidecar) as cached:
+        assert float(cached['table_hits']) == 6.0
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from thlscan_reader import parse_pixel_table, read_scan_file
+
+
+# The per-line parse of the original scripts: split every line, keep the lines that have all requested columns
+def _per_line_parse(block, columns):
+    rows = []
+    for line in block.decode().splitlines():
+        values = line.split()
+        if len(values) > max(columns):
+            rows.append([float(values[column]) for column in columns])
+    return np.array(rows, dtype=float).reshape(len(rows), len(columns))
+
+
+TABLES = {
+    'integer': b'0 0 3\n1 0 0\n2 0 17\n255 255 1\n',
+    'decimal': b'0 0 3.5\n1 0 0.25\n2 0 1e3\n',
+    'crlf': b'0 0 3\r\n1 0 4\r\n2 0 5\r\n',
+    'ragged': b'0 0 3\n1 0\n\n2 0 5 9\n3 0 6\n',
+    'decimal below integer': b'0 0 3\n1 0 4.5\n',
+}
+
+
+@pytest.mark.parametrize('name', list(TABLES))
+@pytest.mark.parametrize('columns', [[2], [0, 1, 2]])
+def test_parse_matches_per_line_parse(name, columns):
+    block = TABLES[name]
+    table = parse_pixel_table(block, columns)
+
+    assert np.array_equal(table, _per_line_parse(block, columns))
+
+
+def test_integer_table_stays_integer():
+    assert parse_pixel_table(TABLES['integer']).dtype == np.int64
+    assert parse_pixel_table(TABLES['decimal'], [2]).dtype == np.float64
+
+
+def test_empty_table():
+    assert parse_pixel_table(b'', [2]).shape == (0, 1)
+
+
+def test_scan_file_hits(tmp_path):
+    header = [f'# header {i}\n' for i in range(38)]
+    header[8] = '# THL = 850\n'
+    path = tmp_path / 'scan.txt'
+    path.write_text(''.join(header) + TABLES['integer'].decode() + '# end\nHits: 21\n')
+
+    assert read_scan_file(str(path)) == (850, 21.0)
+    assert read_scan_file(str(path), thl_range=(900, 990)) is None
@@ -0,0 +1,33 @@
+from thlscan_watch import LiveScan
+
+
+# Scan file with the THL on the 9th line and the pixel table from the 39th line, optionally without the footer
+def _write_scan(path, threshold, hits, footer=True):
+    header = [f'# header {i}\n' for i in range(38)]
+    header[8] = f'# THL = {threshold}\n'
+    table = ''.join(f'{i} 0 {value}\n' for i, value in enumerate(hits))
+    path.write_text(''.join(header) + table + (f'# end\nHits: {sum(hits)}\n' if footer else ''))
+
+
+def test_unreadable_file_reported_once(tmp_path, capsys):
+    path = tmp_path / 'scan.txt'
+    path.write_text('# header 0\n# header 1\n')
+    scan = LiveScan()
+
+    assert not any(scan.add_file(str(path)) for _ in range(3))
+    assert capsys.readouterr().out.count('Skipping file') == 1
+
+    _write_scan(path, 850, [1, 2, 3])
+    assert scan.add_file(str(path))
+    assert scan.hits_values.tolist() == [6]
+
+
+def test_table_mode_takes_stable_file_without_footer(tmp_path):
+    path = tmp_path / 'scan.txt'
+    _write_scan(path, 850, [1, 2, 3], footer=False)
+
+    assert not LiveScan(mode='footer').add_file(str(path))
+    scan = LiveScan(mode='table')
+    assert not scan.add_file(str(path))
+    assert scan.add_file(str(path))
+    assert scan.hits_values.tolist() == [6]
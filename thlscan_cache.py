@@ -0,0 +1,71 @@
+import hashlib
+import os
+import threading
+import zipfile
+import numpy as np
+
+# Default location of the parsed-scan cache; override with the THLSCAN_CACHE_DIR environment variable
+CACHE_DIR = os.environ.get('THLSCAN_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'thlscan'))
+
+
+# Resolve the `cache` argument of the readers: False/None disables caching, True uses CACHE_DIR,
+# a string is taken as the cache directory
+def resolve_cache_dir(cache):
+    if cache is None or cache is False:
+        return None
+    if cache is True:
+        return CACHE_DIR
+    return os.fspath(cache)
+
+
+# One .npz sidecar per source file, named after a hash of its absolute path
+def cache_path(file_path, cache_dir):
+    key = hashlib.sha1(os.path.abspath(file_path).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, key + '.npz')
+
+
+# Load the cached entry of a file as a dict; empty if missing or if the file size or mtime changed.
+# The pixel table is only loaded when with_table is set
+def load_cache_entry(file_path, stat, cache_dir, with_table=False):
+    path = cache_path(file_path, cache_dir)
+    try:
+        with np.load(path) as cached:
+            keys = [key for key in cached.files if with_table or key != 'table']
+            entry = {key: cached[key] for key in keys}
+    except (IOError, ValueError, EOFError, zipfile.BadZipFile):
+        return {}
+
+    if int(entry.get('size', -1)) != stat.st_size or int(entry.get('mtime_ns', -1)) != stat.st_mtime_ns:
+        return {}
+    return entry
+
+
+# Add values to the entry of a file, stamped with the size and mtime they were parsed from;
+# values already cached for the same file version are kept
+def store_cache_entry(file_path, stat, cache_dir, values):
+    os.makedirs(cache_dir, exist_ok=True)
+    entry = load_cache_entry(file_path, stat, cache_dir, with_table=True)
+    entry.update(values, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+
+    # Write to a temporary file first so parallel readers never see a half-written sidecar
+    path = cache_path(file_path, cache_dir)
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+    np.savez(temp_path, **entry)
+    os.replace(temp_path, path)
+
+
+# Store integer pixel tables in the narrowest unsigned dtype that holds them
+def compact_table(table):
+    if table.size and table.dtype.kind == 'i' and table.min() >= 0:
+        return table.astype(np.min_scalar_type(table.max()))
+    return table
+
+
+# Remove every sidecar from the cache directory
+def clear_cache(cache=True):
+    cache_dir = resolve_cache_dir(cache)
+    if cache_dir is None or not os.path.isdir(cache_dir):
+        return
+    for name in os.listdir(cache_dir):
+        if name.endswith('.npz'):
+            os.remove(os.path.join(cache_dir, name))
@@ -0,0 +1,125 @@
+import io
+import json
+import os
+import zipfile
+import numpy as np
+from thlscan_reader import read_scan_table, read_scan_footer, HITS_COLUMN
+from thlscan_cache import compact_table
+
+# A packed scan is a zip of .npy arrays:
+#   index/threshold.npy, index/table_hits.npy, index/footer_hits.npy   one entry per step
+#   tables/<step>.npy                                                   pixel table of each step
+#   sources.json                                                        names of the packed files
+# Steps are stored in input order; the THL index lets a window be read without touching other steps.
+
+
+def _write_array(archive, name, array):
+    buffer = io.BytesIO()
+    np.save(buffer, array)
+    archive.writestr(name, buffer.getvalue())
+
+
+def _read_array(archive, name):
+    return np.load(io.BytesIO(archive.read(name)))
+
+
+# A file path is a packed scan when it is an existing zip with a THL index in it
+def is_scan_container(path):
+    if not isinstance(path, (str, os.PathLike)) or not os.path.isfile(path) or not zipfile.is_zipfile(path):
+        return False
+    with zipfile.ZipFile(path) as archive:
+        return 'index/threshold.npy' in archive.namelist()
+
+
+# Pack the scan files of one threshold scan into container_path (compressed zip of .npy arrays)
+def pack_scan(file_paths, container_path):
+    thresholds = []
+    table_hits = []
+    footer_hits = []
+    sources = []
+
+    with zipfile.ZipFile(container_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for file_path in file_paths:
+            try:
+                threshold, table = read_scan_table(file_path)
+                footer = read_scan_footer(file_path)[1]
+            except (IndexError, ValueError, IOError) as e:
+                print(f"Skipping file with error: {file_path} ({e})")
+                continue
+
+            if threshold is None:
+                print(f"Could not find threshold in file: {file_path}")
+                continue
+
+            # Steps without hits parse to a (0, 0) table; keep the column layout so readers can index it
+            if table.shape[0] == 0:
+                table = np.zeros((0, max(table.shape[1], HITS_COLUMN + 1)), dtype=np.int64)
+
+            step = len(thresholds)
+            _write_array(archive, f'tables/{step}.npy', compact_table(table))
+            hits = table[:, HITS_COLUMN].sum() if table.shape[1] > HITS_COLUMN else 0.0
+            thresholds.append(threshold)
+            table_hits.append(float(hits))
+            footer_hits.append(-1 if footer is None else footer)
+            sources.append(os.path.basename(file_path))
+
+        _write_array(archive, 'index/threshold.npy', np.array(thresholds, dtype=np.int64))
+        _write_array(archive, 'index/table_hits.npy', np.array(table_hits, dtype=np.float64))
+        _write_array(archive, 'index/footer_hits.npy', np.array(footer_hits, dtype=np.int64))
+        archive.writestr('sources.json', json.dumps(sources))
+
+    return len(thresholds)
+
+
+# Steps of the container inside thl_range, in the order the serial reader would return them
+def _select_steps(thresholds, thl_range):
+    steps = np.arange(thresholds.size)
+    if thl_range is not None:
+        steps = steps[(thresholds >= thl_range[0]) & (thresholds <= thl_range[1])]
+    return steps[np.argsort(thresholds[steps])]
+
+
+# Read threshold and hits arrays sorted by threshold from a packed scan. Only the index is read;
+# mode='footer' uses the 'Hits:' totals and drops steps whose footer was missing
+def read_container(container_path, thl_range=None, mode='table'):
+    with zipfile.ZipFile(container_path) as archive:
+        thresholds = _read_array(archive, 'index/threshold.npy')
+        hits = _read_array(archive, f'index/{mode}_hits.npy')
+
+    if mode == 'footer':
+        valid = np.flatnonzero(hits >= 0)
+        thresholds, hits = thresholds[valid], hits[valid]
+    steps = _select_steps(thresholds, thl_range)
+    return thresholds[steps], hits[steps]
+
+
+# Thresholds (sorted) and step numbers of the container steps inside thl_range, from the index only
+def read_container_steps(container_path, thl_range=None):
+    with zipfile.ZipFile(container_path) as archive:
+        thresholds = _read_array(archive, 'index/threshold.npy')
+    steps = _select_steps(thresholds, thl_range)
+    return thresholds[steps], steps
+
+
+# Yield the pixel tables of the given steps one at a time, keeping only one table in memory
+def iter_container_tables(container_path, steps):
+    with zipfile.ZipFile(container_path) as archive:
+        for step in steps:
+            table = _read_array(archive, f'tables/{step}.npy')
+            yield table.astype(np.int64) if table.dtype.kind == 'u' else table
+
+
+# Read the pixel tables of the steps inside thl_range, sorted by threshold; other steps stay untouched
+def read_container_tables(container_path, thl_range=None):
+    thresholds, steps = read_container_steps(container_path, thl_range)
+    return thresholds, list(iter_container_tables(container_path, steps))
+
+
+# Usage: python thlscan_container.py "D:\...\Mo_40_2_RT_*.txt" Mo_40_2_RT.zip
+if __name__ == '__main__':
+    import glob
+    import sys
+
+    scan_file_paths = sorted(glob.glob(sys.argv[1]))
+    n_steps = pack_scan(scan_file_paths, sys.argv[2])
+    print(f"Packed {n_steps} of {len(scan_file_paths)} files into {sys.argv[2]}")
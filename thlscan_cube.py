@@ -0,0 +1,87 @@
+import tempfile
+import numpy as np
+from thlscan_reader import read_scan_threshold, read_scan_table, X_COLUMN, Y_COLUMN, HITS_COLUMN
+from thlscan_container import is_scan_container, read_container_steps, iter_container_tables
+
+# Timepix pixel matrix (rows, cols)
+MATRIX_SHAPE = (256, 256)
+
+# Cubes larger than this (in bytes) are backed by a .npy memmap instead of RAM
+MEMMAP_THRESHOLD = 512 * 1024 ** 2
+
+
+# Allocate the (n_thl, rows, cols) cube, memory-mapped when memmap_path is given or the cube is large
+def _allocate_cube(n_steps, shape, dtype, memmap_path):
+    cube_shape = (n_steps,) + tuple(shape)
+    n_bytes = int(np.prod(cube_shape)) * np.dtype(dtype).itemsize
+    if memmap_path is None and n_bytes <= MEMMAP_THRESHOLD:
+        return np.zeros(cube_shape, dtype=dtype)
+
+    if memmap_path is None:
+        # Anonymous temporary file: the OS removes it once the cube is released
+        return np.memmap(tempfile.TemporaryFile(prefix='thlscan_cube_'), mode='w+', dtype=dtype, shape=cube_shape)
+    # open_memmap writes a .npy header, so the cube can be reopened later with np.load(mmap_mode='r')
+    return np.lib.format.open_memmap(memmap_path, mode='w+', dtype=dtype, shape=cube_shape)
+
+
+# Scatter the counts of one pixel table into a (rows, cols) frame; repeated pixels are summed.
+# Steps without hits (empty tables) give an empty frame
+def fill_frame(frame, table):
+    rows, cols = frame.shape
+    if table.shape[0] == 0 or table.shape[1] <= HITS_COLUMN:
+        frame[...] = 0
+        return
+    x = table[:, X_COLUMN].astype(np.int64)
+    y = table[:, Y_COLUMN].astype(np.int64)
+    inside = (x >= 0) & (x < cols) & (y >= 0) & (y < rows)
+    pixel = y[inside] * cols + x[inside]
+    counts = np.bincount(pixel, weights=table[inside, HITS_COLUMN], minlength=rows * cols)
+    frame[...] = counts.reshape(rows, cols).astype(frame.dtype)
+
+
+# Steps (file path, threshold) of a scan inside thl_range, sorted by threshold, from the headers only
+def _scan_steps(file_paths, thl_range):
+    steps = []
+    for file_path in file_paths:
+        try:
+            threshold = read_scan_threshold(file_path)
+        except (IndexError, ValueError, IOError) as e:
+            print(f"Skipping file with error: {file_path} ({e})")
+            continue
+        if threshold is None:
+            continue
+        if thl_range is not None and not (thl_range[0] <= threshold <= thl_range[1]):
+            continue
+        steps.append((file_path, threshold))
+
+    thresholds = np.array([threshold for _, threshold in steps], dtype=np.int64)
+    order = np.argsort(thresholds)
+    return [steps[i][0] for i in order], thresholds[order]
+
+
+# Build the per-pixel count cube of a threshold scan: cube[i, row, col] holds the counts of pixel
+# (row, col) at thresholds[i]. file_paths is a list of scan files or a packed scan container.
+# Returns (thresholds, cube) with the cube backed by memmap_path (or a temporary file) when large
+def build_scan_cube(file_paths, thl_range=None, shape=MATRIX_SHAPE, dtype=np.uint32, memmap_path=None,
+                    cache=None):
+    if is_scan_container(file_paths):
+        thresholds, steps = read_container_steps(file_paths, thl_range)
+        cube = _allocate_cube(len(steps), shape, dtype, memmap_path)
+        for i, table in enumerate(iter_container_tables(file_paths, steps)):
+            fill_frame(cube[i], table)
+    else:
+        # First pass reads only the headers, so the cube can be allocated before any table is parsed
+        step_paths, thresholds = _scan_steps(file_paths, thl_range)
+        cube = _allocate_cube(len(step_paths), shape, dtype, memmap_path)
+
+        for i, file_path in enumerate(step_paths):
+            try:
+                _, table = read_scan_table(file_path, cache=cache)
+            except (IndexError, ValueError, IOError) as e:
+                print(f"Skipping file with error: {file_path} ({e})")
+                continue
+            fill_frame(cube[i], table)
+
+    if isinstance(cube, np.memmap):
+        cube.flush()
+    return thresholds, cube
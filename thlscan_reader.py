@@ -0,0 +1,371 @@
+import io
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
+import numpy as np
+from thlscan_cache import resolve_cache_dir, load_cache_entry, store_cache_entry, compact_table
+
+# Layout of a threshold scan file: THL on the 9th line, pixel table from the 39th line
+THL_LINE = 8
+DATA_START_LINE = 38
+HITS_COLUMN = 2
+
+# Pixel table columns holding the pixel coordinates
+X_COLUMN = 0
+Y_COLUMN = 1
+
+THL_PATTERN = re.compile(r'#\s*THL\s*=\s*(\d+)')
+HITS_PATTERN = re.compile(r'Hits:\s*(\d+)')
+
+# Bytes read from the end of the file per step when looking for the footer
+FOOTER_CHUNK = 4096
+
+# Automatic THL window (thl_range='auto'): the edge region is where the derivative of the coarse hit curve
+# stays above AUTO_WINDOW_FRACTION of its peak, padded on both sides by AUTO_WINDOW_PADDING times its width
+# (at least AUTO_WINDOW_MIN_PAD_STEPS steps). Scans without footers are coarsened to AUTO_WINDOW_COARSE_STEPS
+AUTO_WINDOW_FRACTION = 0.05
+AUTO_WINDOW_PADDING = 0.5
+AUTO_WINDOW_MIN_PAD_STEPS = 5
+AUTO_WINDOW_COARSE_STEPS = 32
+
+
+# Offset of the start of line number `line_index` in data, or len(data) if the file is shorter
+def _line_offset(data, line_index, start=0):
+    offset = start
+    for _ in range(line_index):
+        offset = data.find(b'\n', offset)
+        if offset == -1:
+            return len(data)
+        offset += 1
+    return offset
+
+
+# Split the raw file bytes into the THL value and the raw bytes of the pixel table
+def split_scan_bytes(data):
+    thl_start = _line_offset(data, THL_LINE)
+    if thl_start >= len(data):
+        raise IndexError(f"file has fewer than {THL_LINE + 1} lines")
+    thl_end = data.find(b'\n', thl_start)
+    thl_line = data[thl_start:thl_end if thl_end != -1 else len(data)].decode('utf-8', 'replace')
+    match = THL_PATTERN.search(thl_line)
+    threshold = int(match.group(1)) if match else None
+
+    # The pixel table runs from the 39th line up to the next line starting with '#'
+    data_start = _line_offset(data, DATA_START_LINE - THL_LINE, thl_start)
+    if data.startswith(b'#', data_start):
+        data_end = data_start
+    else:
+        data_end = data.find(b'\n#', data_start)
+        data_end = len(data) if data_end == -1 else data_end + 1
+
+    return threshold, data[data_start:data_end]
+
+
+# Parse the pixel table bytes in bulk into a 2D array (one row per pixel line) with a single np.loadtxt call;
+# with `columns` only those columns are converted. The first line sets the dtype: int64 when its requested values
+# are integers, float64 otherwise. np.loadtxt still tokenizes every line (about 0.2 us per 3-column row), which
+# bounds a cold parse at about 3x the old per-line Python loop on one core; the footer mode, the cache
+# (thlscan_cache) and the worker pool of read_scan_files are what go beyond that
+def parse_pixel_table(block, columns=None):
+    first = block.split(b'\n', 1)[0].split()
+    columns = list(range(len(first))) if columns is None else list(columns)
+    if not first or max(columns, default=-1) >= len(first):
+        return _parse_ragged_table(block, columns)
+
+    integer = all(first[column].lstrip(b'+-').isdigit() for column in columns)
+    try:
+        table = np.loadtxt(io.BytesIO(block), dtype=np.int64 if integer else np.float64, usecols=columns, ndmin=2)
+    except ValueError:
+        # Ragged lines, or decimals below an integer first line: fall back to line-by-line parsing
+        return _parse_ragged_table(block, columns)
+    return table.reshape(-1, len(columns))
+
+
+# Slow path for tables with blank or short lines; keeps the rows that have all requested columns
+def _parse_ragged_table(block, columns):
+    rows = []
+    needed = max(columns, default=-1) + 1
+    for line in block.decode().splitlines():
+        values = line.split()
+        if len(values) >= needed:
+            rows.append([float(values[column]) for column in columns])
+    return np.array(rows, dtype=float).reshape(len(rows), len(columns))
+
+
+# Parse one scan file and return (threshold, hits); hits is None when the THL is missing or outside thl_range
+def _parse_scan_file(file_path, thl_range=None):
+    with open(file_path, 'rb') as file:
+        data = file.read()
+
+    threshold, block = split_scan_bytes(data)
+    if threshold is None or not in_thl_range(threshold, thl_range):
+        return threshold, None
+
+    hits = parse_pixel_table(block, columns=[HITS_COLUMN]).sum()  # Summing third column values as hits
+    return threshold, float(hits)
+
+
+# True if threshold lies in the inclusive thl_range (None accepts every THL)
+def in_thl_range(threshold, thl_range):
+    return thl_range is None or thl_range[0] <= threshold <= thl_range[1]
+
+
+# Read one scan file and return (threshold, hits); None if the THL is missing or outside thl_range.
+# cache=True (or a directory) reuses the values parsed on an earlier run, see thlscan_cache
+def read_scan_file(file_path, thl_range=None, cache=None):
+    threshold, hits = read_scan_values(file_path, thl_range, 'table', resolve_cache_dir(cache))
+    if hits is None or not in_thl_range(threshold, thl_range):
+        return None
+    return threshold, hits
+
+
+# Read the THL and the full pixel table of a scan file (int64 for integer tables); the table
+# is kept in the cache as well when cache is set
+def read_scan_table(file_path, cache=None):
+    cache_dir = resolve_cache_dir(cache)
+    if cache_dir is not None:
+        stat = os.stat(file_path)
+        entry = load_cache_entry(file_path, stat, cache_dir, with_table=True)
+        if 'table' in entry:
+            table = entry['table']
+            return _from_cache(entry['threshold'], int), table.astype(np.int64) if table.dtype.kind == 'u' else table
+
+    with open(file_path, 'rb') as file:
+        threshold, block = split_scan_bytes(file.read())
+    table = parse_pixel_table(block)
+
+    if cache_dir is not None:
+        store_cache_entry(file_path, stat, cache_dir, {'threshold': _to_cache(threshold), 'table': compact_table(table)})
+    return threshold, table
+
+
+# Cached values are stored as float64 with NaN standing in for None
+def _to_cache(value):
+    return np.float64(np.nan if value is None else value)
+
+
+def _from_cache(value, value_type):
+    value = float(value)
+    return None if np.isnan(value) else value_type(value)
+
+
+# Threshold and hits of one file in the given mode ('footer' or 'table'), read through the cache when cache_dir is set.
+# Files skipped for their THL keep only the threshold in the cache, so widening thl_range later
+# parses just the newly included files
+def read_scan_values(file_path, thl_range, mode, cache_dir):
+    if cache_dir is None:
+        return read_scan_footer(file_path) if mode == 'footer' else _parse_scan_file(file_path, thl_range)
+
+    stat = os.stat(file_path)
+    entry = load_cache_entry(file_path, stat, cache_dir)
+    hits_key = f'{mode}_hits'
+    hits_type = int if mode == 'footer' else float
+
+    if 'threshold' in entry:
+        threshold = _from_cache(entry['threshold'], int)
+        if hits_key in entry:
+            return threshold, _from_cache(entry[hits_key], hits_type)
+        if mode == 'table' and (threshold is None or not in_thl_range(threshold, thl_range)):
+            return threshold, None
+
+    if mode == 'footer':
+        threshold, hits = read_scan_footer(file_path)
+    else:
+        threshold, hits = _parse_scan_file(file_path, thl_range)
+
+    values = {'threshold': _to_cache(threshold)}
+    if mode == 'footer' or hits is not None:
+        values[hits_key] = _to_cache(hits)
+    store_cache_entry(file_path, stat, cache_dir, values)
+    return threshold, hits
+
+
+# Read the first lines of an open scan file and return the THL, or None if the 9th line does not match
+def _read_header_threshold(file):
+    header = [file.readline() for _ in range(THL_LINE + 1)]
+    if not header[THL_LINE]:
+        raise IndexError(f"file has fewer than {THL_LINE + 1} lines")
+    match = THL_PATTERN.search(header[THL_LINE].decode('utf-8', 'replace'))
+    return int(match.group(1)) if match else None
+
+
+# Read only the header of a scan file and return its THL (None if missing)
+def read_scan_threshold(file_path):
+    with open(file_path, 'rb') as file:
+        return _read_header_threshold(file)
+
+
+# Read only the header and the last line of a scan file and return (threshold, hits);
+# either value is None when its line does not match
+def read_scan_footer(file_path):
+    with open(file_path, 'rb') as file:
+        threshold = _read_header_threshold(file)
+
+        # Seek backwards from the end until the start of the last line is in the buffer
+        file_size = file.seek(0, 2)
+        tail = b''
+        position = file_size
+        while position > 0:
+            step = min(FOOTER_CHUNK, position)
+            position -= step
+            file.seek(position)
+            tail = file.read(step) + tail
+            if tail.find(b'\n', 0, len(tail) - 1) != -1:
+                break
+
+    last_line = tail[tail.rfind(b'\n', 0, len(tail) - 1) + 1:]
+    match_hits = HITS_PATTERN.search(last_line.decode('utf-8', 'replace'))
+    hits = int(match_hits.group(1)) if match_hits else None
+    return threshold, hits
+
+
+# Read one file in the given mode; returns (threshold, hits) or None if the file is skipped
+def _read_scan_entry(file_path, thl_range=None, mode='table', cache_dir=None):
+    try:
+        threshold, hits = read_scan_values(file_path, thl_range, mode, cache_dir)
+    except (IndexError, ValueError, IOError) as e:
+        print(f"Skipping file with error: {file_path} ({e})")
+        return None
+
+    if mode == 'footer':
+        if threshold is None:
+            print(f"Could not find threshold in file: {file_path}")
+            return None
+        if hits is None:
+            print(f"Could not find hits in file: {file_path}")
+            return None
+
+    if hits is None or not in_thl_range(threshold, thl_range):
+        return None
+    return threshold, hits
+
+
+# Read every file with _read_scan_entry, in input order. With workers > 1 the files are spread over
+# a process pool ('table' mode is CPU bound) or a thread pool ('footer' mode is I/O bound)
+def _read_scan_entries(file_paths, thl_range=None, mode='table', workers=None, cache=None):
+    file_paths = list(file_paths)
+    cache_dir = resolve_cache_dir(cache)
+    if workers is None or workers <= 1 or len(file_paths) < 2:
+        return [_read_scan_entry(file_path, thl_range, mode, cache_dir) for file_path in file_paths]
+
+    executor_class = ThreadPoolExecutor if mode == 'footer' else ProcessPoolExecutor
+    chunksize = max(1, len(file_paths) // (workers * 4))
+    with executor_class(max_workers=workers) as executor:
+        return list(executor.map(_read_scan_entry, file_paths, repeat(thl_range), repeat(mode), repeat(cache_dir),
+                                 chunksize=chunksize))
+
+
+# Turn a list of (threshold, hits) entries into threshold and hits arrays sorted by threshold
+def _sorted_scan_arrays(entries):
+    entries = [entry for entry in entries if entry is not None]
+    threshold_np = np.array([entry[0] for entry in entries])
+    hits_np = np.array([entry[1] for entry in entries])
+
+    sorted_indices = np.argsort(threshold_np)
+    return threshold_np[sorted_indices], hits_np[sorted_indices]
+
+
+# Header and footer of one file for the coarse pass; (None, None) when the file cannot be read
+def _read_coarse_entry(file_path, cache_dir):
+    try:
+        return read_scan_values(file_path, None, 'footer', cache_dir)
+    except (IndexError, ValueError, IOError) as e:
+        print(f"Skipping file with error: {file_path} ({e})")
+        return None, None
+
+
+# Edge window (low, high) of a sorted hit curve, see AUTO_WINDOW_FRACTION; None when there is no edge
+def edge_window(threshold_np, hits_np, fraction=AUTO_WINDOW_FRACTION, padding=AUTO_WINDOW_PADDING):
+    if threshold_np.size < 3:
+        return None
+
+    # Derivative in the direction of the edge, lightly smoothed so a single noisy step does not end the region
+    diff = np.diff(hits_np.astype(float)) * (1 if hits_np[-1] >= hits_np[0] else -1)
+    diff = np.convolve(diff, np.ones(3) / 3, mode='same')
+    peak = np.argmax(diff)
+    if diff[peak] <= 0:
+        return None
+
+    below = np.flatnonzero(diff <= fraction * diff[peak])
+    left = below[below < peak].max(initial=-1) + 1
+    right = below[below > peak].min(initial=diff.size)
+    low, high = threshold_np[left], threshold_np[right]
+
+    step = np.median(np.diff(threshold_np))
+    pad = max(padding * (high - low), AUTO_WINDOW_MIN_PAD_STEPS * step)
+    return int(max(low - pad, threshold_np[0])), int(np.ceil(min(high + pad, threshold_np[-1])))
+
+
+# Two-pass THL window detection. The first pass reads only the header and the 'Hits:' footer of every file;
+# when footers are missing, the pixel tables of an evenly spaced subset of AUTO_WINDOW_COARSE_STEPS steps are
+# parsed instead. Returns (window, paths inside the window); window is None (all paths kept) without an edge
+def find_thl_window(file_paths, fraction=AUTO_WINDOW_FRACTION, padding=AUTO_WINDOW_PADDING, workers=None,
+                    cache=None):
+    file_paths = list(file_paths)
+    cache_dir = resolve_cache_dir(cache)
+    if workers is None or workers <= 1 or len(file_paths) < 2:
+        coarse = [_read_coarse_entry(file_path, cache_dir) for file_path in file_paths]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            coarse = list(executor.map(_read_coarse_entry, file_paths, repeat(cache_dir)))
+
+    thresholds = {file_path: threshold for file_path, (threshold, _) in zip(file_paths, coarse) if threshold is not None}
+    complete = [(threshold, hits) for threshold, hits in coarse if threshold is not None and hits is not None]
+    if len(complete) >= len(thresholds) / 2:
+        threshold_np, hits_np = _sorted_scan_arrays(complete)
+    else:
+        steps = sorted(thresholds, key=thresholds.get)
+        stride = max(1, len(steps) // AUTO_WINDOW_COARSE_STEPS)
+        threshold_np, hits_np = read_scan_files(steps[::stride], workers=workers, cache=cache)
+
+    window = edge_window(threshold_np, hits_np, fraction, padding)
+    if window is None:
+        print("No edge found in the coarse scan, keeping the full THL range")
+        return None, [file_path for file_path in file_paths if file_path in thresholds]
+
+    print(f"Automatic THL window: {window[0]}..{window[1]}")
+    return window, [file_path for file_path, threshold in thresholds.items() if in_thl_range(threshold, window)]
+
+
+# Read a list of scan files and return threshold and hits arrays sorted by threshold.
+# mode='table' sums the hits column of the pixel table, mode='footer' takes the 'Hits:' total.
+# workers > 1 parses the files in parallel (see _read_scan_entries); cache=True (or a directory)
+# keeps the parsed values in .npz sidecars so re-runs on unchanged files skip the text parsing.
+# thl_range='auto' finds the edge window with find_thl_window and parses only the files inside it.
+# file_paths may also be the path of a scan packed with thlscan_container.pack_scan
+def read_scan_files(file_paths, thl_range=None, mode='table', workers=None, cache=None):
+    from thlscan_container import is_scan_container, read_container
+    if is_scan_container(file_paths):
+        if thl_range == 'auto':
+            thl_range = edge_window(*read_container(file_paths, None, 'table'))
+        return read_container(file_paths, thl_range, mode)
+
+    if thl_range == 'auto':
+        thl_range, file_paths = find_thl_window(file_paths, workers=workers, cache=cache)
+    return _sorted_scan_arrays(_read_scan_entries(file_paths, thl_range, mode, workers, cache))
+
+
+# Read several scans at once, e.g. {'10°C': paths, '20°C': paths}; all files share one pool so
+# small scans still keep every worker busy. Returns {key: (threshold_np, hits_np)} in the same order
+def read_scan_file_sets(file_paths_dict, thl_range=None, mode='table', workers=None, cache=None):
+    from thlscan_container import is_scan_container
+    scans = dict.fromkeys(file_paths_dict)
+    file_sets = {key: list(paths) for key, paths in file_paths_dict.items() if not is_scan_container(paths)}
+    if thl_range == 'auto':
+        # Each scan gets its own window; the files outside it are dropped before the shared pass
+        file_sets = {key: find_thl_window(paths, workers=workers, cache=cache)[1] for key, paths in file_sets.items()}
+
+    all_paths = [path for paths in file_sets.values() for path in paths]
+    entries = _read_scan_entries(all_paths, None if thl_range == 'auto' else thl_range, mode, workers, cache)
+
+    offset = 0
+    for key, paths in file_sets.items():
+        scans[key] = _sorted_scan_arrays(entries[offset:offset + len(paths)])
+        offset += len(paths)
+
+    # Packed scans are read straight from their THL index
+    for key, paths in file_paths_dict.items():
+        if key not in file_sets:
+            scans[key] = read_scan_files(paths, thl_range, mode)
+    return scans
@@ -0,0 +1,177 @@
+import glob
+import os
+import time
+import numpy as np
+from thlscan_reader import read_scan_footer, read_scan_values, in_thl_range
+from thlscan_cache import resolve_cache_dir
+from edge_estimator import estimate_edge
+
+# Steps needed before the first edge estimate (the differentiated scan needs a few points for the spline)
+MIN_FIT_STEPS = 5
+
+
+# Running threshold scan: thresholds and hits kept sorted by threshold as steps arrive, with the
+# derivative of the hit curve updated on every insert and the edge refitted every `refit_every` new steps
+class LiveScan:
+    def __init__(self, thl_range=None, mode='footer', refit_every=5, method='spline', cache=None):
+        self.thl_range = thl_range
+        self.mode = mode
+        self.refit_every = refit_every
+        self.method = method
+        self.cache_dir = resolve_cache_dir(cache)
+
+        self.threshold_values = np.empty(0, dtype=np.int64)
+        self.hits_values = np.empty(0, dtype=float)
+        self.diff_pixel_counts = np.empty(0, dtype=float)
+        self.edge = None  # (mean, sigma, fwhm) of the last fit
+        self.steps_since_fit = 0
+        self.seen = {}  # file path -> (size, mtime_ns) of the version already ingested
+        self.pending = {}  # file path -> (size, mtime_ns) at the previous poll, for files without a footer
+        self.deferred = set()  # files that could not be read yet, reported once each
+
+    # Insert one step; a repeated threshold replaces the earlier value
+    def add_step(self, threshold, hits):
+        index = np.searchsorted(self.threshold_values, threshold)
+        if index < self.threshold_values.size and self.threshold_values[index] == threshold:
+            self.hits_values[index] = hits
+        else:
+            self.threshold_values = np.insert(self.threshold_values, index, threshold)
+            self.hits_values = np.insert(self.hits_values, index, hits)
+
+        # Only the (at most two) differences next to the new step change
+        if self.threshold_values.size != self.diff_pixel_counts.size + 1:
+            self.diff_pixel_counts = np.insert(self.diff_pixel_counts, min(index, self.diff_pixel_counts.size), 0.0)
+        for i in (index - 1, index):
+            if 0 <= i < self.diff_pixel_counts.size:
+                self.diff_pixel_counts[i] = self.hits_values[i + 1] - self.hits_values[i]
+        self.steps_since_fit += 1
+
+    # Ingest a scan file once it is complete; returns True if a step was added. A file is complete when its 'Hits:'
+    # footer is written or, in mode='table' (which does not need the footer), when its size and mtime are unchanged
+    # since the previous poll. Files still being written are left for the next poll; a file that cannot be read yet
+    # (e.g. its header is not written) is reported on the first poll only and retried on the next ones
+    def add_file(self, file_path):
+        try:
+            stat = os.stat(file_path)
+            version = (stat.st_size, stat.st_mtime_ns)
+            if self.seen.get(file_path) == version:
+                return False
+            threshold, footer_hits = read_scan_footer(file_path)
+            if footer_hits is None:
+                stable = self.pending.get(file_path) == version
+                self.pending[file_path] = version
+                if self.mode == 'footer' or not stable:
+                    return False
+            self.pending.pop(file_path, None)
+            self.seen[file_path] = version
+            self.deferred.discard(file_path)
+
+            if threshold is None or not in_thl_range(threshold, self.thl_range):
+                return False
+            if self.mode == 'footer':
+                hits = footer_hits
+            else:
+                threshold, hits = read_scan_values(file_path, self.thl_range, 'table', self.cache_dir)
+        except (IndexError, ValueError, IOError) as e:
+            if file_path not in self.deferred:
+                self.deferred.add(file_path)
+                print(f"Skipping file with error: {file_path} ({e})")
+            return False
+
+        if hits is None:
+            return False
+        self.add_step(threshold, hits)
+        return True
+
+    # Refit the edge when at least refit_every steps arrived since the last fit; returns True if refitted
+    def update_edge(self, force=False):
+        if self.threshold_values.size < MIN_FIT_STEPS or self.steps_since_fit == 0:
+            return False
+        if not force and self.steps_since_fit < self.refit_every:
+            return False
+
+        try:
+            self.edge = estimate_edge(self.threshold_values, self.hits_values, method=self.method)
+        except ValueError as e:
+            print(f"Edge estimate failed: {e}")
+            return False
+        self.steps_since_fit = 0
+        return True
+
+    def summary(self):
+        if self.threshold_values.size == 0:
+            return "No steps yet"
+        text = (f"{self.threshold_values.size} steps, THL {self.threshold_values[0]}..{self.threshold_values[-1]}, "
+                f"{self.hits_values.sum():.0f} hits")
+        if self.edge is not None:
+            mean, sigma, fwhm = self.edge
+            text += f" | Mean: {mean:.2f}, Sigma: {sigma:.2f}, FWHM: {fwhm:.2f}"
+        return text
+
+
+# Live plot of the hit curve and its derivative with the current edge estimate
+class LivePlot:
+    def __init__(self):
+        import matplotlib.pyplot as plt
+        self.plt = plt
+        plt.ion()
+        self.figure, (self.ax_hits, self.ax_diff) = plt.subplots(2, 1, figsize=(10, 8), sharex=True)
+
+    def draw(self, scan):
+        self.ax_hits.clear()
+        self.ax_diff.clear()
+        self.ax_hits.plot(scan.threshold_values, scan.hits_values, 'o-', color='blue', label='Event Counts')
+        self.ax_hits.set_ylabel('Event Count')
+        self.ax_hits.set_title('Threshold Scan (live)')
+        self.ax_diff.plot(scan.threshold_values[1:], scan.diff_pixel_counts, 'o-', color='green',
+                          label='Increase in Event Counts')
+        self.ax_diff.set_xlabel('Threshold Value')
+        self.ax_diff.set_ylabel('Increase in Event Count')
+
+        if scan.edge is not None and np.isfinite(scan.edge[0]):
+            mean, sigma, fwhm = scan.edge
+            self.ax_diff.axvline(mean, color='red', linestyle='--', label=f'Mean: {mean:.2f}')
+            self.ax_diff.axvspan(mean - fwhm / 2, mean + fwhm / 2, color='red', alpha=0.1,
+                                 label=f'FWHM: {fwhm:.2f}, Sigma: {sigma:.2f}')
+        for ax in (self.ax_hits, self.ax_diff):
+            ax.grid(True)
+            ax.legend()
+        self.plt.pause(0.01)
+
+
+# Follow a scan directory: every poll_interval seconds the files matching `pattern` are checked, new complete
+# steps are added and the edge is refitted every refit_every steps. Stops after idle_timeout seconds without
+# new files (None waits until Ctrl+C) and returns the LiveScan with the final estimate
+def watch_scan(pattern, thl_range=None, mode='footer', refit_every=5, poll_interval=2.0, idle_timeout=None,
+               method='spline', plot=False, cache=None):
+    scan = LiveScan(thl_range, mode, refit_every, method, cache)
+    live_plot = LivePlot() if plot else None
+    last_new_step = time.monotonic()
+
+    try:
+        while True:
+            added = sum(scan.add_file(file_path) for file_path in sorted(glob.glob(pattern)))
+            if added:
+                last_new_step = time.monotonic()
+                if scan.update_edge():
+                    print(scan.summary())
+                    if live_plot is not None:
+                        live_plot.draw(scan)
+            elif idle_timeout is not None and time.monotonic() - last_new_step > idle_timeout:
+                break
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        print("Stopped watching")
+
+    scan.update_edge(force=True)
+    print(scan.summary())
+    if live_plot is not None:
+        live_plot.draw(scan)
+    return scan
+
+
+# Usage: python thlscan_watch.py "D:\...\Mo_40_2_RT_*.txt" [refit_every]
+if __name__ == '__main__':
+    import sys
+
+    watch_scan(sys.argv[1], refit_every=int(sys.argv[2]) if len(sys.argv) > 2 else 5, plot=True)